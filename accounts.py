@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Test account leasing, so parallel runs never log in as the same user.
+
+``selenium_cfg.TEST_ACCOUNTS`` maps the username a test asks for to the pool
+of real accounts that can stand in for it::
+
+    TEST_ACCOUNTS = {
+        'justa_tester': [('justa_tester', 'testing1'),
+                         ('justa_tester2', 'testing1')],
+    }
+
+:meth:`utils.Browser.login` leases one of them with :func:`lease_account`.
+Each account is guarded by an exclusive ``flock`` on a file in
+``selenium_cfg.ACCOUNT_LOCK_DIR``, so a lease is held against other threads
+and other processes on the same machine, and is dropped by the OS if the
+process holding it dies.
+
+Locks on one machine mean nothing to another, so when tests run under
+:mod:`coordinator` workers on several hosts the coordinator hands out the
+accounts instead. Workers tell the tests where it is through the
+``SELENIUM_COORDINATOR`` and ``SELENIUM_WORK_ITEM`` environment variables;
+only usernames go over the wire, and an item's accounts are given back
+when it is reported or its worker stops heartbeating.
+
+"""
+import os
+import time
+import fcntl
+import socket
+import tempfile
+import xmlrpclib
+
+import selenium_cfg
+
+
+class LeaseTimeout(Exception):
+    """ Raised when no account in a pool frees up in time. """
+
+
+class AccountLease(object):
+    """ An account held exclusively until :meth:`release` is called.
+
+        :param str pool: Name of the pool the account came from
+        :param str username: Account username
+        :param str password: Account password
+        :param file lock_file: Open lock file holding the ``flock``
+        :param tuple coordinator: ``(address, item id)`` the account was
+            leased from instead, see :func:`lease_account`
+
+    """
+    def __init__(self, pool, username, password, lock_file=None,
+            coordinator=None):
+        self.pool = pool
+        self.username = username
+        self.password = password
+        self._lock_file = lock_file
+        self._coordinator = coordinator
+
+    def release(self):
+        """ Gives the account back to the pool. Safe to call more than once.
+        """
+        if self._lock_file:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+        if self._coordinator:
+            address, item_id = self._coordinator
+            self._coordinator = None
+            try:
+                _proxy(address).release_account(item_id, self.username)
+            except (socket.error, xmlrpclib.Error):
+                # gone, and everything it handed out with it
+                pass
+
+    def __repr__(self):
+        return '<AccountLease(%s from %s)>' % (self.username, self.pool)
+
+
+def get_lock_dir():
+    lock_dir = (getattr(selenium_cfg, 'ACCOUNT_LOCK_DIR', None)
+            or os.path.join(tempfile.gettempdir(), 'selenium_accounts'))
+    if not os.path.exists(lock_dir):
+        try:
+            os.makedirs(lock_dir)
+        except OSError:
+            # another worker made it first
+            pass
+    return lock_dir
+
+
+def lease_account(name, timeout=None, username=None):
+    """ Leases a free account from the pool for ``name``.
+
+        :param str name: Username the test asked for
+        :param int timeout: Seconds to wait for a free account (default:
+            ``selenium_cfg.ACCOUNT_LEASE_TIMEOUT``)
+        :param str username: Wait for this account of the pool in
+            particular (optional)
+        :returns: :class:`AccountLease`, or None if ``name`` has no pool
+        :raises: LeaseTimeout
+
+    """
+    pool = getattr(selenium_cfg, 'TEST_ACCOUNTS', {}).get(name)
+    if username:
+        pool = [account for account in pool or () if account[0] == username]
+    if not pool:
+        return None
+
+    if timeout is None:
+        timeout = getattr(selenium_cfg, 'ACCOUNT_LEASE_TIMEOUT', 300)
+    address = os.environ.get('SELENIUM_COORDINATOR')
+    if address:
+        take = _remote_taker(address, int(os.environ['SELENIUM_WORK_ITEM']))
+    else:
+        take = _local_taker(get_lock_dir())
+
+    deadline = time.time() + timeout
+    while True:
+        lease = take(name, pool)
+        if lease:
+            return lease
+
+        if time.time() > deadline:
+            raise LeaseTimeout('No account from the %s pool freed up in %ss'
+                    % (name, timeout))
+        time.sleep(0.5)
+
+
+def _local_taker(lock_dir):
+    def take(name, pool):
+        for username, password in pool:
+            lock_file = open(os.path.join(lock_dir, username + '.lock'), 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except IOError:
+                lock_file.close()
+                continue
+            return AccountLease(name, username, password, lock_file)
+    return take
+
+
+def _remote_taker(address, item_id):
+    def take(name, pool):
+        username = _proxy(address).lease_account(item_id,
+                [username for username, password in pool])
+        if username:
+            return AccountLease(name, username, dict(pool)[username],
+                    coordinator=(address, item_id))
+    return take
+
+
+def _proxy(address):
+    # proxies aren't thread safe, so every call gets its own
+    return xmlrpclib.ServerProxy(address, allow_none=True)
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+"""
+Wait conditions that are checked inside the page.
+
+Waiting on a Python predicate with ``browser.wait(lambda b: ...)`` costs a
+round trip to the driver on every poll, and polls are spaced out, so changes
+are noticed late. Passing one of these conditions to
+:meth:`utils.Browser.wait` instead runs a single async script that checks the
+condition whenever the DOM changes (through a ``MutationObserver``) and
+returns the moment it holds::
+
+    >>> browser.wait(conditions.visible('.ui-dialog.welcome')).click()
+    >>> browser.wait(5, conditions.text('Saved', '.notification.banner'))
+    >>> orig_url = browser.current_url
+    >>> browser.contains('Publish').click()
+    >>> browser.wait(conditions.url_changes(orig_url))
+
+Element conditions return the element they matched, the rest return True.
+Every condition is also a plain predicate, ``condition(browser)``, checked
+from Python, which is what is used if the page can't run the script.
+
+"""
+
+
+class Condition(object):
+    """ A condition checked in the page by :meth:`utils.Browser.wait`.
+
+        :param str check: Body of a JavaScript function of ``root`` (the node
+            to search within) and ``args`` that returns something truthy once
+            the condition holds
+        :param list args: Arguments passed to ``check`` as ``args``
+        :param callable fallback: Python predicate taking a browser, used
+            when the check can't run in the page
+        :param str description: Used in timeout messages
+
+    """
+    # Search root, a WebElement or None for the whole document
+    root = None
+
+    def __init__(self, check, args, fallback, description):
+        self.check = check
+        self.args = list(args)
+        self.fallback = fallback
+        self.description = description
+
+    @property
+    def script(self):
+        return WAIT_SCRIPT % self.check
+
+    def __call__(self, browser):
+        return self.fallback(browser)
+
+    def __repr__(self):
+        return '<Condition(%s)>' % self.description
+
+
+# Async script run by Browser.wait(). Resolves with the check's result as
+# soon as it is truthy, or with null once the timeout (in ms) has passed.
+WAIT_SCRIPT = """
+var callback = arguments[arguments.length - 1];
+var timeout = arguments[0], root = arguments[1] || document, args = arguments[2];
+var check = function (root, args) { %s };
+var done = false, observer = null, poll = null, timer = null;
+
+function finish(value) {
+    if (done) return;
+    done = true;
+    if (observer) observer.disconnect();
+    clearInterval(poll);
+    clearTimeout(timer);
+    callback(value);
+}
+
+function test() {
+    var value = null;
+    try {
+        value = check(root, args);
+    } catch (e) {}
+    if (value) finish(value);
+}
+
+test();
+if (!done) {
+    if (window.MutationObserver) {
+        observer = new MutationObserver(test);
+        observer.observe(document.documentElement, {childList: true,
+            subtree: true, attributes: true, characterData: true});
+    }
+    // for what mutations don't report, like stylesheet visibility changes
+    poll = setInterval(test, 250);
+    timer = setTimeout(function () { finish(null); }, timeout);
+}
+"""
+
+_VISIBLE = """
+function visible(el) {
+    return (el.offsetWidth || el.offsetHeight || el.getClientRects().length)
+        && window.getComputedStyle(el).visibility != 'hidden';
+}
+"""
+
+
+def _first(elements, test=None):
+    for element in elements:
+        if test is None or test(element):
+            return element
+    return False
+
+
+def present(selector):
+    """ Met once an element matching a CSS selector is in the page.
+
+        :param str selector: CSS selector
+        :returns: the element
+    """
+    return Condition(
+            "return root.querySelector(args[0]);",
+            [selector],
+            lambda b: _first(b.find_elements_by_css_selector(selector)),
+            'present %r' % selector)
+
+
+def visible(selector):
+    """ Met once an element matching a CSS selector is displayed.
+
+        :param str selector: CSS selector
+        :returns: the element
+    """
+    return Condition(
+            _VISIBLE + """
+            var els = root.querySelectorAll(args[0]);
+            for (var i = 0; i < els.length; i++) {
+                if (visible(els[i])) return els[i];
+            }
+            """,
+            [selector],
+            lambda b: _first(b.find_elements_by_css_selector(selector),
+                lambda e: e.is_displayed()),
+            'visible %r' % selector)
+
+
+def text(text, selector=None):
+    """ Met once some text is in the page, or in an element matching a CSS
+        selector.
+
+        :param str text: Text to look for
+        :param str selector: CSS selector (optional)
+        :returns: the element if a selector was given, otherwise True
+    """
+    def fallback(b):
+        if selector:
+            return _first(b.find_elements_by_css_selector(selector),
+                    lambda e: text in e.text)
+        if condition.root is not None:
+            return text in condition.root.text
+        return text in b.find_element_by_tag_name('body').text
+
+    condition = Condition(
+            """
+            if (!args[1]) {
+                var body = root.body || root;
+                return body.textContent.indexOf(args[0]) != -1;
+            }
+            var els = root.querySelectorAll(args[1]);
+            for (var i = 0; i < els.length; i++) {
+                if (els[i].textContent.indexOf(args[0]) != -1) return els[i];
+            }
+            """,
+            [text, selector],
+            fallback,
+            'text %r in %r' % (text, selector or 'page'))
+    return condition
+
+
+def url_changes(url):
+    """ Met once the page's URL is no longer ``url``.
+
+        :param str url: The URL before the change, usually
+            ``browser.current_url``
+    """
+    return Condition(
+            "return window.location.href != args[0];",
+            [url],
+            lambda b: b.current_url != url,
+            'url changes from %r' % url)
+
+
+def removed(selector):
+    """ Met once no element in the page matches a CSS selector.
+
+        :param str selector: CSS selector
+    """
+    return Condition(
+            "return !root.querySelector(args[0]);",
+            [selector],
+            lambda b: not b.find_elements_by_css_selector(selector),
+            'removed %r' % selector)
+
+
+# Index of elements by their own text nodes, built once per page and kept
+# current by a MutationObserver, so finding text doesn't rescan the whole
+# document with XPath every time. Own text nodes are joined with NULs so a
+# match can't span two of them, like XPath's text()[contains(., ...)].
+TEXT_INDEX = """
+var index = window.__seleniumTextIndex;
+if (!index || index.doc !== document) {
+    index = window.__seleniumTextIndex = {doc: document, entries: [],
+        dropped: 0, observer: null};
+
+    index.add = function (el) {
+        var text = '';
+        for (var n = el.firstChild; n; n = n.nextSibling) {
+            if (n.nodeType === 3) text += n.nodeValue + '\\u0000';
+        }
+        if (el.__seleniumText === undefined) {
+            if (!text) return;
+            index.entries.push(el);
+        }
+        el.__seleniumText = text;
+    };
+
+    index.addTree = function (node) {
+        if (node.nodeType !== 1) return;
+        index.add(node);
+        var els = node.getElementsByTagName('*');
+        for (var i = 0; i < els.length; i++) index.add(els[i]);
+    };
+
+    index.drop = function (el) {
+        if (el.__seleniumText === undefined) return;
+        el.__seleniumText = undefined;
+        index.dropped++;
+    };
+
+    index.dropTree = function (node) {
+        if (node.nodeType !== 1) return;
+        index.drop(node);
+        var els = node.getElementsByTagName('*');
+        for (var i = 0; i < els.length; i++) index.drop(els[i]);
+    };
+
+    // removals are dropped as they happen, rather than every entry being
+    // checked against the page on every query
+    index.update = function (records) {
+        var html = document.documentElement;
+        for (var i = 0; i < records.length; i++) {
+            var record = records[i];
+            if (record.type === 'characterData') {
+                var parent = record.target.parentNode;
+                if (parent && parent.nodeType === 1) index.add(parent);
+                continue;
+            }
+            if (record.target.nodeType === 1) index.add(record.target);
+            for (var j = 0; j < record.removedNodes.length; j++) {
+                index.dropTree(record.removedNodes[j]);
+            }
+            for (j = 0; j < record.addedNodes.length; j++) {
+                // not if it was taken off the page again since
+                if (html.contains(record.addedNodes[j])) {
+                    index.addTree(record.addedNodes[j]);
+                }
+            }
+        }
+        if (index.dropped > index.entries.length / 2) index.compact();
+    };
+
+    // drops the slots of dropped elements, and the second slot of any that
+    // were dropped and added back
+    index.compact = function () {
+        var kept = [];
+        for (var i = 0; i < index.entries.length; i++) {
+            var el = index.entries[i];
+            if (el.__seleniumText === undefined || el.__seleniumKept) continue;
+            el.__seleniumKept = true;
+            kept.push(el);
+        }
+        for (i = 0; i < kept.length; i++) kept[i].__seleniumKept = undefined;
+        index.entries = kept;
+        index.dropped = 0;
+    };
+
+    index.sync = function () {
+        if (index.observer) {
+            index.update(index.observer.takeRecords());
+            return;
+        }
+        // no mutation tracking, so rebuild for every query
+        for (var i = 0; i < index.entries.length; i++) {
+            index.entries[i].__seleniumText = undefined;
+        }
+        index.entries = [];
+        index.dropped = 0;
+        index.addTree(document.documentElement);
+    };
+
+    index.find = function (text, tag, root, nested) {
+        index.sync();
+        tag = tag.toLowerCase();
+        var html = document.documentElement, found = null, inside = null;
+        var before = function (a, b) {
+            return a.compareDocumentPosition(b) & 4;
+        };
+        for (var i = 0; i < index.entries.length; i++) {
+            var el = index.entries[i];
+            if (el.__seleniumText === undefined
+                    || el.__seleniumText.indexOf(text) === -1) continue;
+            if (!html.contains(el)) {
+                // only if a removal was missed, but that's cheap to check
+                index.drop(el);
+                continue;
+            }
+            if (root && !root.contains(el)) continue;
+            if (tag === '*' || el.tagName.toLowerCase() === tag) {
+                if (!found || before(el, found)) found = el;
+            } else if (nested && !found) {
+                for (var p = el.parentNode; p && p.nodeType === 1; p = p.parentNode) {
+                    if (p.tagName.toLowerCase() === tag) {
+                        if (!inside || before(el, inside)) inside = el;
+                        break;
+                    }
+                }
+            }
+        }
+        return found || inside;
+    };
+
+    index.addTree(document.documentElement);
+    if (window.MutationObserver) {
+        index.observer = new MutationObserver(index.update);
+        index.observer.observe(document, {childList: true, subtree: true,
+            characterData: true});
+    }
+}
+"""
+
+
+def xpath_literal(text):
+    """ Returns ``text`` as an XPath string literal, quotes and all. """
+    if '"' not in text:
+        return '"%s"' % text
+    if "'" not in text:
+        return "'%s'" % text
+    parts = text.split('"')
+    return 'concat(%s)' % ', \'"\', '.join('"%s"' % part for part in parts)
+
+
+def element_with_text(text, tag='*', nested=False):
+    """ Met once an element has a text node containing some text, using the
+        page's text index.
+
+        :param str text: Text to look for
+        :param str tag: Tag the element must have (default: \*)
+        :param bool nested: Also match elements inside a ``tag`` element if
+            no ``tag`` element has the text itself
+        :returns: the first such element in document order
+
+        Set ``root`` on the condition to only look within an element (the
+        element itself included).
+    """
+    condition = Condition(
+            TEXT_INDEX + """
+            return index.find(args[0], args[1],
+                    root === document ? null : root, args[2]);
+            """,
+            [text, tag, nested],
+            None,
+            'element with text %r' % text)
+
+    def fallback(target):
+        literal = xpath_literal(text)
+        root = condition.root
+        if root is not None:
+            return _first(root.find_elements_by_xpath(
+                    'self::%s[text()[contains(., %s)]]'
+                    '|.//%s[text()[contains(., %s)]]'
+                    % (tag, literal, tag, literal)))
+        found = _first(target.find_elements_by_xpath(
+                '//%s[text()[contains(., %s)]]' % (tag, literal)))
+        if not found and nested and tag != '*':
+            found = _first(target.find_elements_by_xpath(
+                    '//%s//*[text()[contains(., %s)]]' % (tag, literal)))
+        return found
+
+    condition.fallback = fallback
+    return condition
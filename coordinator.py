@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+"""
+Work queue for spreading a suite over several machines.
+
+A coordinator holds a queue of work items, each a test module or a range of
+its numbered tests. Workers on any host pull the next item when they are
+free, run it the way :func:`utils.run_numbered_tests` does (in a fresh
+process, so a crash only takes that item down), stream the output back and
+report how it went. Fast workers simply pull more items, so nobody sits idle
+while a slow module finishes elsewhere.
+
+Items are run by :func:`utils.run_main`, the same entry point
+:func:`utils.run_browser_matrix` uses. Workers heartbeat while they run.
+Items held by a worker that stops heartbeating go back on the queue for
+someone else, up to ``max_attempts`` times.
+
+The coordinator also hands out the test accounts of
+``selenium_cfg.TEST_ACCOUNTS``, since the locks :mod:`accounts` takes on one
+host can't keep a worker on another from logging in as the same user.
+
+Items run without checkpoints, and only an item starting at test 0 runs the
+module's ``setup_class``, so a range that starts later has to be able to
+run on its own.
+
+Start a coordinator, then as many workers as you like::
+
+    $ python coordinator.py serve test_login test_spotlight_hireme:0-3
+    $ python coordinator.py work http://coordinator-host:8765
+
+Or try it out with local workers::
+
+    >>> import coordinator
+    >>> coordinator.run_local(['test_login', 'test_spotlight_hireme'], workers=2)
+
+"""
+import os
+import sys
+import json
+import time
+import socket
+import threading
+import subprocess
+import xmlrpclib
+from collections import deque
+from SocketServer import ThreadingMixIn
+from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+import utils
+
+
+DEFAULT_PORT = 8765
+HEARTBEAT_INTERVAL = 5 # in seconds
+HEARTBEAT_TIMEOUT = 30 # in seconds
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_item(spec):
+    """ Turns ``module``, ``module:N`` or ``module:N-M`` into a work item. """
+    module, _, tests = spec.partition(':')
+    item = {'module': module, 'initial': 0, 'through': 99}
+    if tests:
+        first, _, last = tests.partition('-')
+        item['initial'] = int(first)
+        item['through'] = int(last or first)
+    return item
+
+
+class Coordinator(object):
+    """ Hands out work items to workers and collects their results.
+
+        :param list items: Work items (see :func:`parse_item`) or specs
+        :param int heartbeat_timeout: Seconds without a heartbeat before a
+            worker's items are put back on the queue
+        :param int max_attempts: Times an item is handed out before it is
+            failed for good
+
+    """
+    def __init__(self, items, heartbeat_timeout=HEARTBEAT_TIMEOUT,
+            max_attempts=3):
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_attempts = max_attempts
+        self.items = {}
+        self.queue = deque()
+        for i, item in enumerate(items):
+            if isinstance(item, basestring):
+                item = parse_item(item)
+            item = dict(item, id=i)
+            self.items[i] = item
+            self.queue.append(i)
+
+        self.leases = {}      # item id -> worker
+        self.attempts = {}    # item id -> times handed out
+        self.heartbeats = {}  # worker -> time of last heartbeat
+        self.output = {}      # item id -> output lines
+        self.results = {}     # item id -> result
+        self.accounts = {}    # username -> item id holding it
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+
+    ### Called by workers over XML-RPC ###
+
+    def pull(self, worker):
+        """ Returns ``{'status': 'work', 'item': item}``, ``{'status':
+            'wait'}`` while other workers still hold items, or ``{'status':
+            'done'}``.
+        """
+        with self.lock:
+            self.heartbeats[worker] = time.time()
+            self._requeue_dead_workers()
+            while self.queue:
+                item_id = self.queue.popleft()
+                if item_id in self.results:
+                    continue
+                self.leases[item_id] = worker
+                self.attempts[item_id] = self.attempts.get(item_id, 0) + 1
+                self.output[item_id] = []
+                return {'status': 'work', 'item': self.items[item_id]}
+            if self.leases:
+                return {'status': 'wait'}
+            return {'status': 'done'}
+
+    def heartbeat(self, worker):
+        with self.lock:
+            self.heartbeats[worker] = time.time()
+        return True
+
+    def stream(self, worker, item_id, text):
+        """ Takes output from a running item. """
+        with self.lock:
+            if self.leases.get(item_id) != worker:
+                return False
+            self.output[item_id].append(text)
+        item = self.items[item_id]
+        for line in text.splitlines():
+            print "[%s %s] %s" % (worker, _describe(item), line)
+        return True
+
+    def report(self, worker, item_id, passed, tests):
+        """ Records the outcome of an item.
+
+            :param bool passed: Whether every test passed
+            :param list tests: ``[test name, error or None]`` pairs
+        """
+        with self.lock:
+            if item_id in self.results:
+                # someone else finished it after this worker was given up on
+                return False
+            self.leases.pop(item_id, None)
+            self._release_accounts(item_id)
+            self.results[item_id] = {'worker': worker, 'passed': passed,
+                    'tests': tests, 'output': ''.join(self.output.get(item_id, []))}
+            self._check_finished()
+        return True
+
+    def lease_account(self, item_id, usernames):
+        """ Leases the first of ``usernames`` no other item holds.
+
+            :returns: the username, or None if they're all taken
+        """
+        with self.lock:
+            for username in usernames:
+                if username not in self.accounts:
+                    self.accounts[username] = item_id
+                    return username
+        return None
+
+    def release_account(self, item_id, username):
+        with self.lock:
+            if self.accounts.get(username) == item_id:
+                del self.accounts[username]
+        return True
+
+    ### Bookkeeping ###
+
+    def _release_accounts(self, item_id):
+        for username, holder in self.accounts.items():
+            if holder == item_id:
+                del self.accounts[username]
+
+    def _requeue_dead_workers(self):
+        now = time.time()
+        for item_id, worker in self.leases.items():
+            if now - self.heartbeats.get(worker, 0) <= self.heartbeat_timeout:
+                continue
+            del self.leases[item_id]
+            self._release_accounts(item_id)
+            print "[coordinator] %s stopped heartbeating, dropping %s" % (
+                    worker, _describe(self.items[item_id]))
+            if self.attempts[item_id] >= self.max_attempts:
+                self.results[item_id] = {'worker': worker, 'passed': False,
+                        'tests': [], 'output': ''.join(self.output[item_id]),
+                        'error': 'gave up after %d attempts' % self.attempts[item_id]}
+            else:
+                # front of the queue, since it has already waited once
+                self.queue.appendleft(item_id)
+        self._check_finished()
+
+    def _check_finished(self):
+        if len(self.results) == len(self.items):
+            self.finished.set()
+
+    def watch(self):
+        """ Requeues items of dead workers even when nobody is pulling. """
+        while not self.finished.wait(self.heartbeat_timeout / 3.0):
+            with self.lock:
+                self._requeue_dead_workers()
+
+    def summary(self):
+        passed = True
+        for item_id in sorted(self.items):
+            result = self.results.get(item_id) or {'worker': None,
+                    'passed': False, 'tests': [], 'error': 'not run'}
+            status = 'ok' if result['passed'] else 'FAIL'
+            print "%-40s %-5s %s" % (_describe(self.items[item_id]), status,
+                    result.get('error') or result['worker'])
+            for name, error in result['tests']:
+                if error:
+                    print "    %s: %s" % (name, error)
+            passed = passed and result['passed']
+        return passed
+
+
+def _describe(item):
+    if item['initial'] == 0 and item['through'] == 99:
+        return item['module']
+    return '%s:%02d-%02d' % (item['module'], item['initial'], item['through'])
+
+
+class _ThreadingServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+class _QuietHandler(SimpleXMLRPCRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(coordinator, host='0.0.0.0', port=DEFAULT_PORT):
+    """ Serves a coordinator in background threads.
+
+        :returns: the server, whose ``server_address`` has the real port
+    """
+    server = _ThreadingServer((host, port), requestHandler=_QuietHandler,
+            allow_none=True, logRequests=False)
+    server.register_instance(coordinator)
+    for target in (server.serve_forever, coordinator.watch):
+        thread = threading.Thread(target=target)
+        thread.daemon = True
+        thread.start()
+    return server
+
+
+def serve(items, host='0.0.0.0', port=DEFAULT_PORT, **kwargs):
+    """ Runs a coordinator until every item has a result, then prints a
+        summary.
+
+        :returns: True if everything passed
+    """
+    coordinator = Coordinator(items, **kwargs)
+    server = start_server(coordinator, host, port)
+    print "[coordinator] serving %d items on port %d" % (
+            len(coordinator.items), server.server_address[1])
+    while not coordinator.finished.wait(1):
+        pass
+    server.shutdown()
+    return coordinator.summary()
+
+
+def work(address, worker=None):
+    """ Pulls items from a coordinator and runs them until it has none left.
+
+        :param str address: Coordinator URL, like ``http://host:8765``
+        :param str worker: Name to report as (default: ``host:pid``)
+
+    """
+    worker = worker or '%s:%d' % (socket.gethostname(), os.getpid())
+    server = xmlrpclib.ServerProxy(address, allow_none=True)
+    stop = threading.Event()
+
+    def _heartbeat():
+        # proxies aren't thread safe, so this thread gets its own
+        proxy = xmlrpclib.ServerProxy(address, allow_none=True)
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                proxy.heartbeat(worker)
+            except (socket.error, xmlrpclib.Error):
+                pass
+
+    heartbeat = threading.Thread(target=_heartbeat)
+    heartbeat.daemon = True
+    heartbeat.start()
+
+    try:
+        while True:
+            try:
+                reply = server.pull(worker)
+            except socket.error:
+                # the coordinator is gone, so there's nothing left to do
+                break
+            if reply['status'] == 'done':
+                break
+            if reply['status'] == 'wait':
+                time.sleep(HEARTBEAT_INTERVAL)
+                continue
+            item = reply['item']
+            try:
+                passed, tests = run_item(item,
+                        lambda text: server.stream(worker, item['id'], text),
+                        address)
+                server.report(worker, item['id'], passed, tests)
+            except (socket.error, xmlrpclib.Error) as e:
+                # the item is requeued once this worker looks dead, or the
+                # coordinator is gone and the next pull says so
+                print "[%s] lost touch with the coordinator running %s: %s" % (
+                        worker, _describe(item), e)
+    finally:
+        stop.set()
+
+
+def run_item(item, stream, address=None):
+    """ Runs a work item in a fresh process.
+
+        :param dict item: Work item
+        :param callable stream: Called with each line of output
+        :param str address: Coordinator URL the item's tests lease their
+            accounts from (optional)
+        :returns: ``(passed, [(test name, error or None), ...])``
+
+        The process is killed if ``stream`` raises.
+
+    """
+    # items of a module can run side by side on one host, and each starts
+    # from its own first test anyway
+    kwargs = {'initial': item['initial'], 'through': item['through'],
+            'checkpoints': False}
+    env = dict(os.environ)
+    if address:
+        env.update(SELENIUM_COORDINATOR=address,
+                SELENIUM_WORK_ITEM=str(item['id']))
+    proc = subprocess.Popen(utils.run_command(item['module'], **kwargs),
+            cwd=HERE, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    tests = []
+    try:
+        for line in iter(proc.stdout.readline, ''):
+            if line.startswith('RESULTS '):
+                tests = json.loads(line[len('RESULTS '):])
+            else:
+                stream(_xml_safe(line))
+    except:
+        proc.kill()
+        proc.wait()
+        raise
+    return proc.wait() == 0, tests
+
+
+def _xml_safe(text):
+    """ Drops what XML-RPC can't carry, like the bells run_numbered_tests
+        rings when it's done.
+    """
+    text = text.decode('utf-8', 'replace')
+    return u''.join(c for c in text if c >= u' ' or c in u'\t\n\r')
+
+
+def run_local(items, workers=2, **kwargs):
+    """ Runs a coordinator with some workers on this machine.
+
+        :param list items: Work items or specs
+        :param int workers: Number of worker processes
+        :returns: True if everything passed
+
+    """
+    coordinator = Coordinator(items, **kwargs)
+    server = start_server(coordinator, '127.0.0.1', 0)
+    address = 'http://127.0.0.1:%d' % server.server_address[1]
+    procs = [subprocess.Popen([sys.executable, __file__, 'work', address])
+            for _ in range(workers)]
+    try:
+        while not coordinator.finished.wait(1):
+            if all(proc.poll() is not None for proc in procs):
+                # every worker died; requeueing won't help
+                break
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+        server.shutdown()
+    return coordinator.summary()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == 'serve':
+        sys.exit(0 if serve(sys.argv[2:]) else 1)
+    elif len(sys.argv) == 3 and sys.argv[1] == 'work':
+        work(sys.argv[2])
+    else:
+        print __doc__
+        sys.exit(2)
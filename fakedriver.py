@@ -0,0 +1,1097 @@
+# -*- coding: utf-8 -*-
+"""
+In-process WebDriver backends, for exercising :class:`utils.Browser`,
+:func:`utils.autobrowser` and :func:`utils.run_numbered_tests` without
+launching a browser.
+
+They all plug in underneath Selenium's remote ``WebDriver`` as its
+``command_executor``, so everything above the wire protocol (WebElements,
+the ``Browser`` wrapper, its proxying) is the real code:
+
+:class:`FakeConnection`
+    Answers commands from a small in-memory DOM built from HTML strings. It
+    understands CSS selectors (tags, ids, classes, attributes, descendant and
+    child combinators) and the XPath the helpers use. It can't run
+    JavaScript: scripts get a JavaScript error unless a handler was
+    registered with :meth:`FakeConnection.on_script`, which the helpers are
+    expected to cope with.
+
+:class:`RecordingConnection`
+    Wraps a real driver's connection and writes every command and response
+    to a file, one JSON object per line.
+
+:class:`ReplayConnection`
+    Serves a recorded file back, in order, failing as soon as the commands
+    stop matching the recording.
+
+Usage::
+
+    >>> import fakedriver, utils
+    >>> fakedriver.PAGES['/login'] = '<input id="login"><input id="password">'
+    >>> b = utils.get_browser('fake')
+    >>> b.go('/login')
+    >>> b('#login').send_keys('justa_tester')
+
+    # record a real session, then play it back
+    >>> b = utils.Browser(fakedriver.record(selenium.webdriver.Firefox(), 'login.jsonl'))
+    >>> b = utils.Browser(fakedriver.replay_driver('login.jsonl'))
+
+    # how many wrapped operations per second the harness manages
+    >>> fakedriver.benchmark()
+
+``test_fakedriver.py`` runs the helpers on it, so they can be checked in CI
+without a browser.
+
+"""
+import re
+import json
+import time
+import urlparse
+import itertools
+from HTMLParser import HTMLParser
+
+from selenium.webdriver.remote.webdriver import WebDriver
+from selenium.webdriver.remote.command import Command
+
+
+# Pages served by FakeConnection when none are given, keyed by full URL or
+# by path. Values are HTML or a callable taking the URL and returning HTML.
+PAGES = {}
+
+NOT_FOUND = '<html><head><title>Not Found</title></head><body>Not Found</body></html>'
+
+# 1x1 white PNG for screenshots
+BLANK_PNG = ('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADElEQVR4nGP4//8/'
+        'AAX+Av4N70a4AAAAAElFTkSuQmCC')
+
+# Wire protocol status codes
+SUCCESS = 0
+NO_SUCH_ELEMENT = 7
+UNKNOWN_COMMAND = 9
+STALE_ELEMENT_REFERENCE = 10
+JAVASCRIPT_ERROR = 17
+INVALID_COOKIE_DOMAIN = 24
+INVALID_SELECTOR = 32
+
+VOID_TAGS = set(('area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+        'link', 'meta', 'param', 'source', 'track', 'wbr'))
+HIDDEN_TAGS = set(('head', 'script', 'style', 'title', 'meta', 'link'))
+
+
+class FakeError(Exception):
+    """ Turned into an error response by :class:`FakeConnection`. """
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class ReplayDiverged(Exception):
+    """ Raised by :class:`ReplayConnection` when the commands stop matching
+        the recording. It isn't a ``WebDriverException``, so the helpers that
+        retry or fall back on driver errors don't hide it.
+    """
+
+
+### In-memory DOM ###
+
+class Text(object):
+    """ A text node. """
+    def __init__(self, value, parent):
+        self.value = value
+        self.parent = parent
+
+
+class Node(object):
+    """ An element node. """
+    def __init__(self, tag, attrs=None, parent=None):
+        self.tag = tag
+        self.attrs = dict(attrs or {})
+        self.parent = parent
+        self.children = []
+        self.value = self.attrs.get('value', '')
+
+    @property
+    def elements(self):
+        return [c for c in self.children if isinstance(c, Node)]
+
+    @property
+    def texts(self):
+        return [c for c in self.children if isinstance(c, Text)]
+
+    @property
+    def classes(self):
+        return self.attrs.get('class', '').split()
+
+    def descendants(self):
+        """ Yields every element below this one, in document order. """
+        for child in self.elements:
+            yield child
+            for node in child.descendants():
+                yield node
+
+    def text_nodes(self):
+        """ Yields every text node below this one, in document order. """
+        for child in self.children:
+            if isinstance(child, Text):
+                yield child
+            else:
+                for text in child.text_nodes():
+                    yield text
+
+    def text_content(self):
+        return u''.join(t.value for t in self.text_nodes())
+
+    def is_displayed(self):
+        node = self
+        while node is not None and node.tag != '#document':
+            style = node.attrs.get('style', '').replace(' ', '').lower()
+            if (node.tag in HIDDEN_TAGS or 'hidden' in node.attrs
+                    or 'display:none' in style
+                    or 'visibility:hidden' in style
+                    or node.attrs.get('type') == 'hidden'):
+                return False
+            node = node.parent
+        return node is not None
+
+    def visible_text(self):
+        """ Text as WebDriver reports it: only what is displayed, with
+            whitespace collapsed.
+        """
+        if not self.is_displayed():
+            return u''
+
+        def _collect(node):
+            for child in node.children:
+                if isinstance(child, Text):
+                    yield child.value
+                elif child.is_displayed():
+                    for value in _collect(child):
+                        yield value
+        return u' '.join(u''.join(_collect(self)).split())
+
+    def attached(self):
+        node = self
+        while node.parent is not None:
+            node = node.parent
+        return node.tag == '#document'
+
+    def remove(self):
+        if self.parent is not None:
+            self.parent.children.remove(self)
+            self.parent = None
+
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.document = Node('#document')
+        self.current = self.document
+
+    def handle_starttag(self, tag, attrs):
+        node = Node(tag, [(k, v if v is not None else '') for k, v in attrs],
+                self.current)
+        self.current.children.append(node)
+        if tag not in VOID_TAGS:
+            self.current = node
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.current = self.current.parent
+
+    def handle_endtag(self, tag):
+        node = self.current
+        while node.tag != '#document' and node.tag != tag:
+            node = node.parent
+        if node.tag == tag:
+            self.current = node.parent
+
+    def handle_data(self, data):
+        self.current.children.append(Text(data, self.current))
+
+    def handle_entityref(self, name):
+        self.handle_data(self.unescape('&%s;' % name))
+
+    def handle_charref(self, name):
+        self.handle_data(self.unescape('&#%s;' % name))
+
+
+def parse_html(html):
+    """ Returns the ``#document`` :class:`Node` for some HTML. """
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    document = builder.document
+    # like a browser, make sure there is a body to hold fragments
+    if not any(node.tag == 'body' for node in document.descendants()):
+        html = Node('html', parent=document)
+        body = Node('body', parent=html)
+        html.children.append(body)
+        for child in document.children:
+            child.parent = body
+        body.children = document.children
+        document.children = [html]
+    for node in document.descendants():
+        if node.tag == 'textarea':
+            node.value = node.text_content()
+    return document
+
+
+### CSS selectors ###
+
+_CSS_TOKEN = re.compile(r"""
+    (?P<combinator>\s*>\s*|\s+)
+  | (?P<tag>[a-zA-Z][\w-]*|\*)
+  | \#(?P<id>[\w-]+)
+  | \.(?P<cls>[\w-]+)
+  | \[\s*(?P<attr>[\w-]+)\s*(?:(?P<op>[~^$*|]?=)\s*
+        (?:"(?P<dq>[^"]*)"|'(?P<sq>[^']*)'|(?P<bare>[^\]\s]*)))?\s*\]
+""", re.VERBOSE)
+
+
+def _parse_css(selector):
+    """ Returns a list of selectors, each a list of (combinator, compound)
+        pairs from left to right.
+    """
+    groups = []
+    for group in selector.split(','):
+        group = group.strip()
+        steps = []
+        compound = None
+        combinator = ' '
+        pos = 0
+        while pos < len(group):
+            match = _CSS_TOKEN.match(group, pos)
+            if not match:
+                raise FakeError(INVALID_SELECTOR,
+                        'Unsupported CSS selector: %s' % selector)
+            pos = match.end()
+            if match.group('combinator') is not None:
+                if compound is not None:
+                    steps.append((combinator, compound))
+                    compound = None
+                combinator = match.group('combinator').strip() or ' '
+                continue
+            if compound is None:
+                compound = {'tag': '*', 'id': None, 'classes': [], 'attrs': []}
+            if match.group('tag'):
+                compound['tag'] = match.group('tag').lower()
+            elif match.group('id'):
+                compound['id'] = match.group('id')
+            elif match.group('cls'):
+                compound['classes'].append(match.group('cls'))
+            else:
+                value = match.group('dq')
+                if value is None:
+                    value = match.group('sq')
+                if value is None:
+                    value = match.group('bare')
+                compound['attrs'].append(
+                        (match.group('attr'), match.group('op'), value))
+        if compound is None:
+            raise FakeError(INVALID_SELECTOR, 'Empty CSS selector: %s' % selector)
+        steps.append((combinator, compound))
+        groups.append(steps)
+    return groups
+
+
+def _matches_compound(node, compound):
+    if compound['tag'] != '*' and node.tag != compound['tag']:
+        return False
+    if compound['id'] and node.attrs.get('id') != compound['id']:
+        return False
+    classes = node.classes
+    for cls in compound['classes']:
+        if cls not in classes:
+            return False
+    for name, op, value in compound['attrs']:
+        if name not in node.attrs:
+            return False
+        actual = node.attrs[name]
+        if ((op == '=' and actual != value)
+                or (op == '~=' and value not in actual.split())
+                or (op == '^=' and not actual.startswith(value))
+                or (op == '$=' and not actual.endswith(value))
+                or (op == '*=' and value not in actual)
+                or (op == '|=' and actual != value
+                    and not actual.startswith(value + '-'))):
+            return False
+    return True
+
+
+def _matches_steps(node, steps):
+    combinator, compound = steps[-1]
+    if not _matches_compound(node, compound):
+        return False
+    if len(steps) == 1:
+        return True
+    rest = steps[:-1]
+    parent = node.parent
+    if combinator == '>':
+        return (parent is not None and parent.tag != '#document'
+                and _matches_steps(parent, rest))
+    while parent is not None and parent.tag != '#document':
+        if _matches_steps(parent, rest):
+            return True
+        parent = parent.parent
+    return False
+
+
+def css_select(root, selector):
+    """ Returns the elements below ``root`` matching a CSS selector. """
+    groups = _parse_css(selector)
+    return [node for node in root.descendants()
+            if any(_matches_steps(node, steps) for steps in groups)]
+
+
+### XPath ###
+
+_XPATH_TOKEN = re.compile(r"""\s*(?:
+    (?P<op>//|/|::|\.\.|\.|\||\[|\]|\(|\)|,|@|!=|=|\*)
+  | "(?P<dq>[^"]*)" | '(?P<sq>[^']*)'
+  | (?P<num>\d+(?:\.\d+)?)
+  | (?P<name>[a-zA-Z_][\w-]*)
+)""", re.VERBOSE)
+
+
+def _tokenize_xpath(xpath):
+    tokens = []
+    pos = 0
+    xpath = xpath.strip()
+    while pos < len(xpath):
+        match = _XPATH_TOKEN.match(xpath, pos)
+        if not match or match.end() == pos:
+            raise FakeError(INVALID_SELECTOR, 'Unsupported XPath: %s' % xpath)
+        pos = match.end()
+        if match.group('op'):
+            tokens.append(('op', match.group('op')))
+        elif match.group('dq') is not None:
+            tokens.append(('str', match.group('dq')))
+        elif match.group('sq') is not None:
+            tokens.append(('str', match.group('sq')))
+        elif match.group('num'):
+            tokens.append(('num', float(match.group('num'))))
+        else:
+            tokens.append(('name', match.group('name')))
+    return tokens
+
+
+def _string_value(item):
+    if isinstance(item, Text):
+        return item.value
+    if isinstance(item, Node):
+        return item.text_content()
+    return item
+
+
+def _to_string(value):
+    if isinstance(value, list):
+        return _string_value(value[0]) if value else u''
+    if isinstance(value, bool):
+        return u'true' if value else u'false'
+    if isinstance(value, float):
+        return unicode(int(value)) if value == int(value) else unicode(value)
+    return value
+
+
+def _to_bool(value):
+    # empty node sets and strings, zero and False are all false
+    return bool(value)
+
+
+class _XPathParser(object):
+    """ Compiles the subset of XPath 1.0 used by the helpers into a function
+        of the context node.
+    """
+    FUNCTIONS = {
+        'contains': lambda a, b: _to_string(b) in _to_string(a),
+        'starts-with': lambda a, b: _to_string(a).startswith(_to_string(b)),
+        'normalize-space': lambda a: u' '.join(_to_string(a).split()),
+        'concat': lambda *args: u''.join(_to_string(a) for a in args),
+        'string': lambda a: _to_string(a),
+        'not': lambda a: not _to_bool(a),
+    }
+
+    def __init__(self, xpath):
+        self.xpath = xpath
+        self.tokens = _tokenize_xpath(xpath)
+        self.pos = 0
+
+    def parse(self):
+        expr = self.union()
+        if self.pos != len(self.tokens):
+            self.fail()
+        return expr
+
+    def fail(self):
+        raise FakeError(INVALID_SELECTOR, 'Unsupported XPath: %s' % self.xpath)
+
+    def peek(self, offset=0):
+        if self.pos + offset < len(self.tokens):
+            return self.tokens[self.pos + offset]
+        return (None, None)
+
+    def take(self, kind=None, value=None):
+        token = self.peek()
+        if (kind and token[0] != kind) or (value and token[1] != value):
+            self.fail()
+        self.pos += 1
+        return token
+
+    def accept(self, value):
+        if self.peek() == ('op', value):
+            self.pos += 1
+            return True
+        return False
+
+    def union(self):
+        paths = [self.path()]
+        while self.accept('|'):
+            paths.append(self.path())
+        if len(paths) == 1:
+            return paths[0]
+
+        def _union(context):
+            seen = []
+            for path in paths:
+                for item in path(context):
+                    if not any(item is s for s in seen):
+                        seen.append(item)
+            return _document_order(seen)
+        return _union
+
+    def path(self):
+        steps = []
+        absolute = False
+        token = self.peek()
+        if token in (('op', '/'), ('op', '//')):
+            absolute = True
+        else:
+            steps.append(('child', self.step()))
+        while self.peek() in (('op', '/'), ('op', '//')):
+            axis = 'descendant' if self.take()[1] == '//' else 'child'
+            steps.append((axis, self.step()))
+
+        def _path(context):
+            if absolute:
+                root = context
+                while root.parent is not None:
+                    root = root.parent
+                items = [root]
+            else:
+                items = [context]
+            for axis, step in steps:
+                found = []
+                for item in items:
+                    for result in step(item, axis):
+                        if not any(result is f for f in found):
+                            found.append(result)
+                items = found
+            return items
+        return _path
+
+    def step(self):
+        token = self.peek()
+        if token == ('name', 'self') and self.peek(1) == ('op', '::'):
+            # self::tag, only at the start of a path
+            self.pos += 2
+            name = self.take()[1]
+            if name != '*':
+                name = name.lower()
+            test = lambda item, axis: [item] if isinstance(item, Node) and (
+                    name == '*' or item.tag == name) else []
+        elif token == ('op', '.'):
+            self.pos += 1
+            test = lambda item, axis: _axis(item, axis, self_only=True)
+        elif token == ('op', '..'):
+            self.pos += 1
+            test = lambda item, axis: [item.parent] if item.parent else []
+        elif token == ('op', '@'):
+            self.pos += 1
+            name = self.take('name')[1]
+            return lambda item, axis: ([item.attrs[name]]
+                    if isinstance(item, Node) and name in item.attrs else [])
+        elif token == ('op', '*'):
+            self.pos += 1
+            test = lambda item, axis: [n for n in _axis(item, axis)
+                    if isinstance(n, Node)]
+        elif token[0] == 'name' and self.peek(1) == ('op', '('):
+            name = self.take()[1]
+            self.take('op', '(')
+            self.take('op', ')')
+            if name == 'text':
+                test = lambda item, axis: [n for n in _axis(item, axis)
+                        if isinstance(n, Text)]
+            elif name == 'node':
+                test = lambda item, axis: _axis(item, axis)
+            else:
+                self.fail()
+        elif token[0] == 'name':
+            name = self.take()[1].lower()
+            test = lambda item, axis: [n for n in _axis(item, axis)
+                    if isinstance(n, Node) and n.tag == name]
+        else:
+            self.fail()
+
+        predicates = []
+        while self.accept('['):
+            predicates.append(self.expr())
+            self.take('op', ']')
+
+        def _step(item, axis):
+            items = test(item, axis)
+            for predicate in predicates:
+                kept = []
+                for position, candidate in enumerate(items):
+                    value = predicate(candidate)
+                    if isinstance(value, float):
+                        if value == position + 1:
+                            kept.append(candidate)
+                    elif _to_bool(value):
+                        kept.append(candidate)
+                items = kept
+            return items
+        return _step
+
+    def expr(self):
+        left = self.and_expr()
+        while self.peek() == ('name', 'or'):
+            self.pos += 1
+            right = self.and_expr()
+            left = (lambda l, r: lambda c: _to_bool(l(c)) or _to_bool(r(c)))(left, right)
+        return left
+
+    def and_expr(self):
+        left = self.equality()
+        while self.peek() == ('name', 'and'):
+            self.pos += 1
+            right = self.equality()
+            left = (lambda l, r: lambda c: _to_bool(l(c)) and _to_bool(r(c)))(left, right)
+        return left
+
+    def equality(self):
+        left = self.primary()
+        token = self.peek()
+        if token in (('op', '='), ('op', '!=')):
+            self.pos += 1
+            right = self.primary()
+            negate = token[1] == '!='
+
+            def _equal(context):
+                a, b = left(context), right(context)
+                a = [_string_value(i) for i in a] if isinstance(a, list) else [_to_string(a)]
+                b = [_string_value(i) for i in b] if isinstance(b, list) else [_to_string(b)]
+                equal = any(x == y for x in a for y in b)
+                return not equal if negate else equal
+            return _equal
+        return left
+
+    def primary(self):
+        kind, value = self.peek()
+        if kind == 'str':
+            self.pos += 1
+            return lambda context: value
+        if kind == 'num':
+            self.pos += 1
+            return lambda context: value
+        if (kind, value) == ('op', '('):
+            self.pos += 1
+            inner = self.expr()
+            self.take('op', ')')
+            return inner
+        if (kind == 'name' and self.peek(1) == ('op', '(')
+                and value not in ('text', 'node')):
+            if value not in self.FUNCTIONS:
+                self.fail()
+            function = self.FUNCTIONS[value]
+            self.pos += 2
+            args = []
+            if not self.accept(')'):
+                args.append(self.expr())
+                while self.accept(','):
+                    args.append(self.expr())
+                self.take('op', ')')
+            if value == 'normalize-space' and not args:
+                args = [lambda context: [context]]
+            return lambda context: function(*[a(context) for a in args])
+        return self.path()
+
+
+def _axis(item, axis, self_only=False):
+    if self_only:
+        if axis == 'descendant':
+            return [item] + list(item.descendants()) if isinstance(item, Node) else [item]
+        return [item]
+    if not isinstance(item, Node):
+        return []
+    if axis == 'child':
+        return list(item.children)
+    nodes = []
+    for node in [item] + list(item.descendants()):
+        nodes.extend(node.children)
+    return nodes
+
+
+def _document_order(items):
+    if not items:
+        return items
+    root = items[0]
+    while root.parent is not None:
+        root = root.parent
+    order = {}
+    for i, node in enumerate(_walk(root)):
+        order[id(node)] = i
+    return sorted(items, key=lambda item: order.get(id(item), -1))
+
+
+def _walk(node):
+    yield node
+    for child in getattr(node, 'children', ()):
+        for item in _walk(child):
+            yield item
+
+
+def xpath_select(context, xpath):
+    """ Returns the elements an XPath selects from a context node. """
+    result = _XPathParser(xpath).parse()(context)
+    if not isinstance(result, list):
+        raise FakeError(INVALID_SELECTOR, 'XPath is not a node set: %s' % xpath)
+    return [item for item in result if isinstance(item, Node)]
+
+
+### Connections ###
+
+def _find(root, by, value):
+    if by == 'css selector':
+        return css_select(root, value)
+    if by == 'xpath':
+        return xpath_select(root, value)
+    if by == 'id':
+        return [n for n in root.descendants() if n.attrs.get('id') == value]
+    if by == 'name':
+        return [n for n in root.descendants() if n.attrs.get('name') == value]
+    if by == 'class name':
+        return [n for n in root.descendants() if value in n.classes]
+    if by == 'tag name':
+        return [n for n in root.descendants() if n.tag == value.lower()]
+    if by == 'link text':
+        return [n for n in root.descendants()
+                if n.tag == 'a' and n.visible_text() == value]
+    if by == 'partial link text':
+        return [n for n in root.descendants()
+                if n.tag == 'a' and value in n.visible_text()]
+    raise FakeError(INVALID_SELECTOR, 'Unknown locator strategy: %s' % by)
+
+
+class FakeConnection(object):
+    """ WebDriver command executor backed by an in-memory DOM.
+
+        :param dict pages: HTML by full URL or by path (default:
+            :data:`PAGES`). Values may also be callables taking the URL.
+
+    """
+    def __init__(self, pages=None):
+        self.pages = PAGES if pages is None else pages
+        self.document = parse_html('')
+        self.url = 'about:blank'
+        self.history = []
+        self.cookies = []
+        self.window_size = {'width': 1000, 'height': 800}
+        self.window_position = {'x': 0, 'y': 0}
+        # base64 PNG handed out for screenshots
+        self.screenshot = BLANK_PNG
+        self._elements = {}
+        self._ids = {}
+        self._next_id = itertools.count(1)
+        self._click_handlers = []
+        self._script_handlers = [
+            ('window.selenium_ready', lambda conn, args: True),
+            ('jQuery.active', lambda conn, args: 0),
+        ]
+
+        self._commands = {}
+        for name, handler in (
+                ('NEW_SESSION', self._new_session),
+                ('QUIT', lambda p: None),
+                ('GET', lambda p: self.load(p['url'])),
+                ('GET_CURRENT_URL', lambda p: self.url),
+                ('GET_TITLE', self._title),
+                ('GET_PAGE_SOURCE', lambda p: self.page_source()),
+                ('GO_BACK', self._back),
+                ('REFRESH', lambda p: self.load(self.url, record=False)),
+                ('FIND_ELEMENT', lambda p: self._find_one(self.document, p)),
+                ('FIND_ELEMENTS', lambda p: self._find_all(self.document, p)),
+                ('FIND_CHILD_ELEMENT', lambda p: self._find_one(self._node(p), p)),
+                ('FIND_CHILD_ELEMENTS', lambda p: self._find_all(self._node(p), p)),
+                ('CLICK_ELEMENT', lambda p: self.click(self._node(p))),
+                ('SEND_KEYS_TO_ELEMENT', self._send_keys),
+                ('CLEAR_ELEMENT', self._clear),
+                ('SUBMIT_ELEMENT', lambda p: None),
+                ('GET_ELEMENT_TEXT', lambda p: self._node(p).visible_text()),
+                ('GET_ELEMENT_TAG_NAME', lambda p: self._node(p).tag),
+                ('GET_ELEMENT_ATTRIBUTE', self._attribute),
+                ('GET_ELEMENT_PROPERTY', self._attribute),
+                ('IS_ELEMENT_DISPLAYED', lambda p: self._node(p).is_displayed()),
+                ('IS_ELEMENT_ENABLED', lambda p: 'disabled' not in self._node(p).attrs),
+                ('IS_ELEMENT_SELECTED', lambda p: 'checked' in self._node(p).attrs
+                    or 'selected' in self._node(p).attrs),
+                ('GET_ELEMENT_LOCATION', lambda p: {'x': 0, 'y': 0}),
+                ('GET_ELEMENT_LOCATION_ONCE_SCROLLED_INTO_VIEW', lambda p: {'x': 0, 'y': 0}),
+                ('GET_ELEMENT_SIZE', self._size),
+                ('GET_ELEMENT_RECT', lambda p: dict(self._size(p), x=0, y=0)),
+                ('ELEMENT_EQUALS', lambda p: p['id'] == p['other']),
+                ('EXECUTE_SCRIPT', self._execute_script),
+                ('EXECUTE_ASYNC_SCRIPT', self._execute_script),
+                ('IMPLICIT_WAIT', lambda p: None),
+                ('SET_SCRIPT_TIMEOUT', lambda p: None),
+                ('SET_TIMEOUTS', lambda p: None),
+                ('SET_WINDOW_SIZE', self._set_window_size),
+                ('GET_WINDOW_SIZE', lambda p: dict(self.window_size)),
+                ('SET_WINDOW_POSITION', self._set_window_position),
+                ('GET_WINDOW_POSITION', lambda p: dict(self.window_position)),
+                ('MAXIMIZE_WINDOW', lambda p: None),
+                ('GET_CURRENT_WINDOW_HANDLE', lambda p: 'fake'),
+                ('GET_WINDOW_HANDLES', lambda p: ['fake']),
+                ('GET_ALL_COOKIES', lambda p: [dict(c) for c in self.cookies]),
+                ('ADD_COOKIE', self._add_cookie),
+                ('DELETE_ALL_COOKIES', self._delete_all_cookies),
+                ('DELETE_COOKIE', self._delete_cookie),
+                ('SCREENSHOT', lambda p: self.screenshot)):
+            command = getattr(Command, name, None)
+            if command:
+                self._commands[command] = handler
+
+    ### Hooks for tests ###
+
+    def on_click(self, selector, handler):
+        """ Runs ``handler(connection, node)`` when an element matching a
+            CSS selector is clicked.
+        """
+        self._click_handlers.append((selector, handler))
+
+    def on_script(self, pattern, handler):
+        """ Answers scripts containing ``pattern`` with the result of
+            ``handler(connection, args)``. Element arguments and return values
+            are :class:`Node` instances.
+        """
+        self._script_handlers.insert(0, (pattern, handler))
+
+    def load(self, url, record=True):
+        """ Navigates to a URL. """
+        url = urlparse.urljoin(self.url, url)
+        parts = urlparse.urlsplit(url)
+        page = NOT_FOUND
+        for key in (url, parts.path + ('?' + parts.query if parts.query else ''),
+                parts.path or '/'):
+            if key in self.pages:
+                page = self.pages[key]
+                break
+        if callable(page):
+            page = page(url)
+        if record and self.url != 'about:blank':
+            self.history.append(self.url)
+        self.url = url
+        self.document = parse_html(page)
+
+    def click(self, node):
+        for selector, handler in self._click_handlers:
+            if node in css_select(self.document, selector):
+                return handler(self, node)
+        link = node
+        while link is not None and link.tag != 'a':
+            link = link.parent
+        if link is not None and link.attrs.get('href'):
+            self.load(link.attrs['href'])
+
+    def page_source(self):
+        return _serialize(self.document)
+
+    ### Command executor interface ###
+
+    def execute(self, command, params):
+        handler = self._commands.get(command)
+        if handler is None:
+            return {'status': UNKNOWN_COMMAND, 'value':
+                    {'message': 'Fake driver has no command %s' % command}}
+        try:
+            value = handler(params)
+        except FakeError as e:
+            return {'status': e.status, 'value': {'message': str(e)}}
+        return {'status': SUCCESS, 'sessionId': 'fake',
+                'value': self._wrap(value)}
+
+    def _new_session(self, params):
+        capabilities = dict(params.get('desiredCapabilities') or {})
+        capabilities.setdefault('browserName', 'fake')
+        capabilities['javascriptEnabled'] = False
+        return capabilities
+
+    def _wrap(self, value):
+        if isinstance(value, Node):
+            if id(value) not in self._ids:
+                element_id = str(next(self._next_id))
+                self._ids[id(value)] = element_id
+                self._elements[element_id] = value
+            element_id = self._ids[id(value)]
+            return {'ELEMENT': element_id,
+                    'element-6066-11e4-a52e-4f735466cecf': element_id}
+        if isinstance(value, (list, tuple)):
+            return [self._wrap(v) for v in value]
+        if isinstance(value, dict):
+            return dict((k, self._wrap(v)) for k, v in value.items())
+        return value
+
+    def _unwrap(self, value):
+        if isinstance(value, dict):
+            element_id = (value.get('ELEMENT')
+                    or value.get('element-6066-11e4-a52e-4f735466cecf'))
+            if element_id:
+                return self._node({'id': element_id})
+            return dict((k, self._unwrap(v)) for k, v in value.items())
+        if isinstance(value, list):
+            return [self._unwrap(v) for v in value]
+        return value
+
+    def _node(self, params):
+        node = self._elements.get(params['id'])
+        if node is None or not node.attached() or not self._in_document(node):
+            raise FakeError(STALE_ELEMENT_REFERENCE,
+                    'Element is no longer attached to the DOM')
+        return node
+
+    def _in_document(self, node):
+        while node.parent is not None:
+            node = node.parent
+        return node is self.document
+
+    def _find_all(self, root, params):
+        return _find(root, params['using'], params['value'])
+
+    def _find_one(self, root, params):
+        found = self._find_all(root, params)
+        if not found:
+            raise FakeError(NO_SUCH_ELEMENT, 'Unable to locate element: %s=%s'
+                    % (params['using'], params['value']))
+        return found[0]
+
+    def _title(self, params):
+        titles = css_select(self.document, 'title')
+        return titles[0].text_content().strip() if titles else ''
+
+    def _back(self, params):
+        if self.history:
+            self.load(self.history.pop(), record=False)
+
+    def _send_keys(self, params):
+        node = self._node(params)
+        keys = params.get('text')
+        if keys is None:
+            keys = u''.join(params.get('value', []))
+        # drop special keys (Keys.ENTER and friends)
+        node.value += u''.join(k for k in keys if k < u'\ue000')
+
+    def _clear(self, params):
+        self._node(params).value = ''
+
+    def _attribute(self, params):
+        node = self._node(params)
+        if params['name'] == 'value':
+            return node.value
+        if params['name'] == 'href' and 'href' in node.attrs:
+            return urlparse.urljoin(self.url, node.attrs['href'])
+        return node.attrs.get(params['name'])
+
+    def _size(self, params):
+        if self._node(params).is_displayed():
+            return {'width': 100, 'height': 20}
+        return {'width': 0, 'height': 0}
+
+    def _execute_script(self, params):
+        script = params['script']
+        args = self._unwrap(params.get('args', []))
+        for pattern, handler in self._script_handlers:
+            if pattern in script:
+                return handler(self, args)
+        raise FakeError(JAVASCRIPT_ERROR, 'Fake driver cannot run scripts')
+
+    def _set_window_size(self, params):
+        self.window_size = {'width': params['width'], 'height': params['height']}
+
+    def _set_window_position(self, params):
+        self.window_position = {'x': params['x'], 'y': params['y']}
+
+    def _add_cookie(self, params):
+        cookie = params['cookie']
+        host = urlparse.urlparse(self.url).hostname or ''
+        domain = cookie.get('domain', host).lstrip('.')
+        if host != domain and not host.endswith('.' + domain):
+            raise FakeError(INVALID_COOKIE_DOMAIN,
+                    'Cookie domain %s does not match %s' % (domain, host))
+        self._delete_cookie({'name': cookie['name']})
+        self.cookies.append(dict(cookie))
+
+    def _delete_cookie(self, params):
+        self.cookies = [c for c in self.cookies if c['name'] != params['name']]
+
+    def _delete_all_cookies(self, params):
+        self.cookies = []
+
+
+def _serialize(node):
+    if isinstance(node, Text):
+        return node.value
+    inner = u''.join(_serialize(c) for c in node.children)
+    if node.tag == '#document':
+        return inner
+    attrs = u''.join(u' %s="%s"' % (k, v) for k, v in sorted(node.attrs.items()))
+    if node.tag in VOID_TAGS:
+        return u'<%s%s>' % (node.tag, attrs)
+    return u'<%s%s>%s</%s>' % (node.tag, attrs, inner, node.tag)
+
+
+class RecordingConnection(object):
+    """ Command executor that passes commands on to another one and writes
+        each command, its parameters and the response to a file.
+
+        :param connection: The real command executor
+        :param str path: File to write, one JSON object per line
+
+    """
+    def __init__(self, connection, path):
+        self.connection = connection
+        self.path = path
+        self._file = open(path, 'w')
+
+    def execute(self, command, params):
+        response = self.connection.execute(command, params)
+        self.write(command, params, response)
+        return response
+
+    def write(self, command, params, response):
+        params = dict((k, v) for k, v in params.items() if k != 'sessionId')
+        self._file.write(json.dumps({'command': command, 'params': params,
+                'response': response}) + '\n')
+        self._file.flush()
+        if command == Command.QUIT:
+            self._file.close()
+
+    def __getattr__(self, attr):
+        # keep things like keep_alive and _url of the real connection visible
+        return getattr(self.connection, attr)
+
+
+class ReplayConnection(object):
+    """ Command executor that serves responses recorded by
+        :class:`RecordingConnection`, in order.
+
+        :param str path: File written by :class:`RecordingConnection`
+        :raises: ReplayDiverged when a command doesn't match the recording
+
+    """
+    def __init__(self, path):
+        with open(path) as f:
+            self.entries = [json.loads(line) for line in f if line.strip()]
+        self.position = 0
+
+    def execute(self, command, params):
+        if self.position >= len(self.entries):
+            raise ReplayDiverged('Replay ran out of recorded commands at %s'
+                    % command)
+        entry = self.entries[self.position]
+        if entry['command'] != command:
+            raise ReplayDiverged(
+                    'Replay diverged at command %d: recorded %s, got %s'
+                    % (self.position, entry['command'], command))
+        self.position += 1
+        return entry['response']
+
+
+def fake_driver(pages=None):
+    """ Returns a WebDriver backed by a :class:`FakeConnection`, which is
+        available as its ``command_executor``.
+
+        :param dict pages: Pages to serve (default: :data:`PAGES`)
+
+    """
+    return WebDriver(command_executor=FakeConnection(pages),
+            desired_capabilities={'browserName': 'fake'})
+
+
+def record(driver, path):
+    """ Starts recording a driver's commands and responses to a file.
+
+        :param driver: A started WebDriver
+        :param str path: File to record to
+        :returns: The same driver
+
+    """
+    recorder = RecordingConnection(driver.command_executor, path)
+    # the session was started before recording, so write it up front for
+    # the replay to start from, in the same protocol dialect
+    if getattr(driver, 'w3c', False):
+        response = {'value': {'sessionId': driver.session_id,
+                'capabilities': driver.capabilities}}
+    else:
+        response = {'status': SUCCESS, 'sessionId': driver.session_id,
+                'value': driver.capabilities}
+    recorder.write(Command.NEW_SESSION, {}, response)
+    driver.command_executor = recorder
+    return driver
+
+
+def replay_driver(path):
+    """ Returns a WebDriver that replays a file made by :func:`record`. """
+    connection = ReplayConnection(path)
+    capabilities = connection.entries[0]['response'].get('value') or {}
+    capabilities = capabilities.get('capabilities', capabilities)
+    return WebDriver(command_executor=connection,
+            desired_capabilities=capabilities)
+
+
+BENCHMARK_PAGE = """<html><head><title>Benchmark</title></head><body>
+<div class="skills">
+  <input class="skills" value="one"><input class="skills" value="two">
+  <a class="delete" href="/removed">Delete</a>
+</div>
+<div class="links"><input class="link"><input class="link"></div>
+<p>Hire me <span>now</span></p>
+</body></html>"""
+
+
+def benchmark(operations=1000):
+    """ Measures how many operations per second the harness gets through
+        on a fake driver, so the cost of the ``Browser`` wrapper layers can
+        be tracked without a browser.
+
+        :param int operations: Number of times to run each operation
+        :returns: dict of operation name to operations per second
+
+    """
+    import utils
+
+    browser = utils.Browser(fake_driver({'/': BENCHMARK_PAGE}))
+    browser.go('/')
+
+    @utils.autobrowser
+    def wrapped_test(b):
+        return b.title
+
+    cases = [
+        ('proxied attribute', lambda: browser.current_url),
+        ('find', lambda: browser.find('.skills input')),
+        ('__call__', lambda: browser('.links input.link')),
+        ('contains', lambda: browser.contains('Hire me')),
+        ('not_contains', lambda: browser.not_contains('absent', wait=0)),
+        ('autobrowser', lambda: wrapped_test(browser)),
+    ]
+
+    results = {}
+    for name, case in cases:
+        start = time.time()
+        for _ in xrange(operations):
+            case()
+        elapsed = time.time() - start
+        results[name] = operations / elapsed if elapsed else float('inf')
+        print "%-20s %10.0f ops/s" % (name, results[name])
+    browser.quit()
+    return results
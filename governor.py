@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Keeps track of the driver and browser processes started for the tests so
+they don't pile up.
+
+Every browser made by :func:`utils.get_browser` is registered with the
+:data:`utils.GOVERNOR` instance, which:
+
+* writes the process ids it started to a file per test process in
+  ``selenium_cfg.SELENIUM_PID_DIR``, so the next run can kill whatever a
+  crashed or aborted run left behind (:meth:`ResourceGovernor.reap_orphans`)
+* kills anything still running when a browser quits or the test process exits
+* does the same for other processes started for the tests, like the Xvfb
+  servers of :mod:`xvfb`, which run in process groups of their own
+* tells :func:`utils.autobrowser` when a browser should be swapped for a
+  fresh one, after ``SELENIUM_RECYCLE_AFTER`` tests or once its processes use
+  more than ``SELENIUM_RECYCLE_RSS_MB`` of memory
+
+Process trees are walked with ``psutil`` when it is installed, otherwise by
+reading ``/proc``. Without either (macOS without psutil, say) there is no way
+to tell a process from a later one that reused its pid, so nothing is
+tracked: orphans aren't reaped, nothing is killed after a browser quits, and
+memory based recycling is disabled.
+
+"""
+import os
+import json
+import errno
+import signal
+import tempfile
+import threading
+
+import selenium_cfg
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+class ResourceGovernor(object):
+    """ Tracks, recycles and cleans up browser processes.
+
+        :param str pid_dir: Directory for the pid files (default:
+            ``selenium_cfg.SELENIUM_PID_DIR``)
+        :param int recycle_after: Tests a browser runs before it is recycled
+            (default: ``selenium_cfg.SELENIUM_RECYCLE_AFTER``)
+        :param int max_rss_mb: Memory in MB a browser may use before it is
+            recycled (default: ``selenium_cfg.SELENIUM_RECYCLE_RSS_MB``)
+
+    """
+    def __init__(self, pid_dir=None, recycle_after=None, max_rss_mb=None):
+        self.pid_dir = (pid_dir
+                or getattr(selenium_cfg, 'SELENIUM_PID_DIR', None)
+                or os.path.join(tempfile.gettempdir(), 'selenium_pids'))
+        self.recycle_after = (recycle_after
+                or getattr(selenium_cfg, 'SELENIUM_RECYCLE_AFTER', None))
+        self.max_rss_mb = (max_rss_mb
+                or getattr(selenium_cfg, 'SELENIUM_RECYCLE_RSS_MB', None))
+
+        self._lock = threading.Lock()
+        # (pid, start time) of every process started by this test process
+        self._processes = set()
+        self._pid_file = os.path.join(self.pid_dir, '%d.json' % os.getpid())
+
+    def track(self, browser):
+        """ Starts tracking the processes behind a browser.
+
+            :param browser: :class:`utils.Browser` instance
+        """
+        browser._governor_processes = set()
+        browser._governor_tests = 0
+        for pid in _driver_pids(browser._driver):
+            for process in _process_tree(pid):
+                browser._governor_processes.add(process)
+        if not browser._governor_processes:
+            # an in-process or remote driver, or nothing to tell pids apart
+            return
+
+        with self._lock:
+            self._processes |= browser._governor_processes
+            self._save()
+
+    def release(self, browser):
+        """ Kills whatever is left of a browser's processes, after it quit.
+
+            :param browser: :class:`utils.Browser` instance
+        """
+        processes = set(getattr(browser, '_governor_processes', ()))
+        for pid, start in list(processes):
+            processes |= set(_process_tree(pid))
+        _kill(processes)
+
+        with self._lock:
+            self._processes -= processes
+            self._save()
+        browser._governor_processes = set()
+
+    def track_process(self, pid):
+        """ Starts tracking a process that isn't part of a browser, so it is
+            killed with the rest if the test process dies.
+
+            :param int pid: Process id
+        """
+        processes = set(_process_tree(pid))
+        if not processes:
+            return
+        with self._lock:
+            self._processes |= processes
+            self._save()
+
+    def forget_process(self, pid):
+        """ Stops tracking a process given to :meth:`track_process`, once it
+            has been stopped.
+        """
+        with self._lock:
+            forgotten = set(p for p in self._processes if p[0] == pid)
+            if forgotten:
+                self._processes -= forgotten
+                self._save()
+
+    def count_test(self, browser):
+        """ Records that a test ran on a browser. """
+        browser._governor_tests = getattr(browser, '_governor_tests', 0) + 1
+
+    def should_recycle(self, browser):
+        """ Returns True if a browser has run enough tests, or grown big
+            enough, that it should be replaced.
+
+            :param browser: :class:`utils.Browser` instance
+        """
+        if (self.recycle_after
+                and getattr(browser, '_governor_tests', 0) >= self.recycle_after):
+            return True
+        if self.max_rss_mb and self.rss(browser) > self.max_rss_mb * 1024 * 1024:
+            return True
+        return False
+
+    def rss(self, browser):
+        """ Returns the resident memory in bytes of a browser's processes.
+        """
+        total = 0
+        for pid, start in getattr(browser, '_governor_processes', ()):
+            for process in _process_tree(pid):
+                total += _rss(process[0])
+        return total
+
+    def reap_orphans(self):
+        """ Kills processes recorded by test processes that are no longer
+            running.
+        """
+        if not os.path.isdir(self.pid_dir):
+            return
+        for filename in os.listdir(self.pid_dir):
+            owner = filename.split('.')[0]
+            if not owner.isdigit() or _alive(int(owner)):
+                continue
+            path = os.path.join(self.pid_dir, filename)
+            try:
+                with open(path) as f:
+                    processes = set(tuple(p) for p in json.load(f))
+            except (IOError, ValueError):
+                processes = set()
+            for pid, start in list(processes):
+                processes |= set(_process_tree(pid))
+            _kill(processes)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def shutdown(self):
+        """ Kills every process this test process started. Registered with
+            ``atexit`` by :mod:`utils`.
+        """
+        with self._lock:
+            processes = set(self._processes)
+            for pid, start in list(processes):
+                processes |= set(_process_tree(pid))
+            _kill(processes)
+            self._processes = set()
+            try:
+                os.remove(self._pid_file)
+            except OSError:
+                pass
+
+    def _save(self):
+        if not os.path.isdir(self.pid_dir):
+            try:
+                os.makedirs(self.pid_dir)
+            except OSError:
+                # another test process made it first
+                pass
+        with open(self._pid_file, 'w') as f:
+            json.dump(sorted(self._processes), f)
+
+
+def _driver_pids(driver):
+    """ Returns the ids of the processes a WebDriver launched. """
+    pids = []
+    for owner in ('service', 'binary'):
+        process = getattr(getattr(driver, owner, None), 'process', None)
+        if getattr(process, 'pid', None):
+            pids.append(process.pid)
+    return pids
+
+
+def _start_time(pid):
+    """ Returns when a process started, used to tell a process apart from a
+        later one that reused its pid.
+    """
+    if psutil:
+        try:
+            return psutil.Process(pid).create_time()
+        except psutil.Error:
+            return None
+    try:
+        with open('/proc/%d/stat' % pid) as f:
+            # the command name can contain spaces, so split after it
+            return float(f.read().rsplit(')', 1)[1].split()[19])
+    except (IOError, IndexError, ValueError):
+        return None
+
+
+def _process_tree(pid):
+    """ Returns (pid, start time) for a process and all its descendants. """
+    if psutil:
+        try:
+            parent = psutil.Process(pid)
+            processes = [parent] + parent.children(recursive=True)
+            return [(p.pid, p.create_time()) for p in processes]
+        except psutil.Error:
+            return []
+
+    if not os.path.isdir('/proc'):
+        # no start times to check a pid against before killing it
+        return []
+
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % entry) as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (IOError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    tree = []
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        start = _start_time(current)
+        if start is not None:
+            tree.append((current, start))
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def _rss(pid):
+    if psutil:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return 0
+    try:
+        with open('/proc/%d/statm' % pid) as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, IndexError, ValueError, OSError):
+        return 0
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def _kill(processes):
+    """ Kills (pid, start time) processes that are still the same process.
+    """
+    for pid, start in processes:
+        if start is None or _start_time(pid) != start:
+            # exited, and the pid may belong to something else by now, or
+            # there's no telling
+            continue
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
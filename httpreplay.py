@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+Record the HTTP traffic of a run, and replay it for fast offline runs.
+
+A :class:`ProxyServer` sits between the browser and the site. In ``record``
+mode it passes every request on to the real site and writes the exchange to
+an :class:`Archive` on disk. In ``replay`` mode it answers from the archive
+alone, straight away, so tests run at local disk speed without a network.
+
+The browser reaches it two ways:
+
+* as the site itself: ``DOMAIN_NAME`` points at the server, which forwards
+  to ``upstream``. Links, redirects and cookies naming the real site are
+  rewritten to point back at the server.
+* as an HTTP proxy, through ``get_browser(proxy=...)``, which also catches
+  requests to other hosts like CDNs. Only plain HTTP can be recorded; HTTPS
+  requests through the proxy are tunneled while recording and refused in
+  replay.
+
+The easiest way is to set an environment variable before running tests, and
+:mod:`utils` does the rest::
+
+    $ SELENIUM_HTTP_RECORD=spotlight.json python -c "import utils, test_spotlight_hireme; utils.run_numbered_tests(test_spotlight_hireme)"
+    $ SELENIUM_HTTP_REPLAY=spotlight.json python -c "import utils, test_spotlight_hireme; utils.run_numbered_tests(test_spotlight_hireme)"
+
+Or run a server by hand::
+
+    $ python httpreplay.py record spotlight.json --upstream http://about.me --port 8081
+
+Requests are matched on method, URL and body, leaving out query and body
+parameters that change from run to run, like cache busters and CSRF tokens
+(see :data:`IGNORED_PARAMS`). When the same request was made several times,
+the responses are served in the order they were recorded, and the last one
+after that.
+
+Several processes can record to the same archive at once, like the runs of
+:func:`utils.run_browser_matrix`. Each saves what it recorded every few
+seconds, merging it into what the others saved: a request's responses on
+disk are the ones the process that last recorded it saw.
+
+"""
+import os
+import re
+import json
+import fcntl
+import socket
+import base64
+import select
+import urllib
+import urlparse
+import hashlib
+import argparse
+import httplib
+import threading
+from SocketServer import ThreadingMixIn
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+
+# Headers that only apply to one connection, so they aren't passed on
+HOP_HEADERS = set(['connection', 'keep-alive', 'proxy-authenticate',
+        'proxy-authorization', 'te', 'trailers', 'transfer-encoding',
+        'upgrade', 'proxy-connection', 'content-length'])
+
+# Content types whose bodies get the upstream's URLs rewritten
+TEXT_TYPES = ('text/', 'application/javascript', 'application/json',
+        'application/x-javascript', 'application/xml')
+
+# Query and body parameters left out of request keys, since they differ
+# every run: jQuery's cache buster and the usual CSRF token names
+IGNORED_PARAMS = ('_', 'csrf_token', 'csrfmiddlewaretoken', '_csrf',
+        'authenticity_token')
+
+# Seconds between saves of an archive being recorded
+SAVE_INTERVAL = 5
+
+
+def request_key(method, url, body='', ignore=IGNORED_PARAMS):
+    """ Returns what a request is looked up by in an :class:`Archive`.
+
+        :param list ignore: Names of query parameters, and of form fields or
+            top level JSON keys of the body, to leave out
+    """
+    parts = urlparse.urlsplit(url)
+    query = _without(urlparse.parse_qsl(parts.query, True), ignore)
+    if query is not None:
+        url = urlparse.urlunsplit(parts[:3] + (urllib.urlencode(query),
+                parts.fragment))
+    key = '%s %s' % (method, url)
+    if body:
+        key += ' ' + hashlib.sha1(_normalize_body(body, ignore)).hexdigest()
+    return key
+
+
+def _without(params, ignore):
+    """ Returns ``params`` without the ignored ones, or None if there were
+        none to leave out.
+    """
+    kept = [(name, value) for name, value in params if name not in ignore]
+    if len(kept) < len(params):
+        return kept
+    return None
+
+
+def _normalize_body(body, ignore):
+    try:
+        data = json.loads(body)
+    except ValueError:
+        form = _without(urlparse.parse_qsl(body, True), ignore)
+        return body if form is None else urllib.urlencode(form)
+    if isinstance(data, dict) and set(data) & set(ignore):
+        return json.dumps(dict((name, value) for name, value in data.items()
+                if name not in ignore), sort_keys=True)
+    return body
+
+
+class Archive(object):
+    """ Recorded responses, kept in a JSON file.
+
+        :param str path: Archive file, loaded if it exists
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self.responses = self._load()  # request key -> [response, ...]
+        self._served = {}    # request key -> responses served so far
+        self._recorded = {}  # request key -> [response, ...] added here
+        self._unsaved = set()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except IOError:
+            return {}
+
+    def add(self, key, status, headers, body):
+        """ Records a response. The responses recorded for a request
+            replace those the archive had for it.
+
+            :param list headers: ``(name, value)`` pairs
+        """
+        with self._lock:
+            responses = self._recorded.setdefault(key, [])
+            responses.append({'status': status, 'headers': headers,
+                    'body': base64.b64encode(body)})
+            self.responses[key] = responses
+            self._unsaved.add(key)
+
+    def next(self, key):
+        """ Returns the next ``(status, headers, body)`` recorded for a
+            request, or None if it never was.
+        """
+        with self._lock:
+            responses = self.responses.get(key)
+            if not responses:
+                return None
+            served = self._served.get(key, 0)
+            self._served[key] = served + 1
+            response = responses[min(served, len(responses) - 1)]
+        return (response['status'], response['headers'],
+                base64.b64decode(response['body']))
+
+    def rewind(self):
+        """ Serves every request's responses from the first one again. """
+        with self._lock:
+            self._served = {}
+
+    def save(self):
+        """ Merges what was recorded since the last save into the file,
+            keeping what other processes recording to it saved meanwhile.
+        """
+        with self._lock:
+            recorded = dict((key, list(self._recorded[key]))
+                    for key in self._unsaved)
+            self._unsaved = set()
+        if not recorded and os.path.exists(self.path):
+            return
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            responses = self._load()
+            responses.update(recorded)
+            # written in one go so an interrupted run can't leave half a
+            # file, under a name of its own since the lock is only advisory
+            temp_path = '%s.%d.tmp' % (self.path, os.getpid())
+            with open(temp_path, 'w') as f:
+                json.dump(responses, f, indent=0, sort_keys=True)
+            os.rename(temp_path, self.path)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_CONNECT(self):
+        # HTTPS through the proxy can't be read, so it's tunneled unrecorded
+        if self.server.mode != 'record':
+            self.send_error(502, 'HTTPS is not recorded')
+            return
+        host, _, port = self.path.partition(':')
+        try:
+            upstream = socket.create_connection((host, int(port or 443)), 30)
+        except socket.error as e:
+            self.send_error(502, str(e))
+            return
+        self.send_response(200, 'Connection established')
+        self.end_headers()
+        sockets = [self.connection, upstream]
+        try:
+            while True:
+                readable = select.select(sockets, [], sockets, 60)[0]
+                if not readable:
+                    break
+                for sock in readable:
+                    data = sock.recv(65536)
+                    if not data:
+                        return
+                    (upstream if sock is self.connection else self.connection
+                            ).sendall(data)
+        finally:
+            upstream.close()
+        self.close_connection = 1
+
+    def handle_any(self):
+        body = ''
+        if self.headers.get('content-length'):
+            body = self.rfile.read(int(self.headers['content-length']))
+
+        path = self.path
+        if urlparse.urlsplit(path).netloc == self.server.domain:
+            # the browser sent a request for the server itself to it as a
+            # proxy
+            path = urlparse.urlunsplit(('', '') + urlparse.urlsplit(path)[2:]) or '/'
+        if path.startswith('/'):
+            # used as the site itself
+            url = self.server.upstream + path
+        else:
+            # used as a proxy
+            url = path
+        key = request_key(self.command, url, body, self.server.ignore)
+
+        if self.server.mode == 'record':
+            try:
+                status, headers, content = self.fetch(url, body)
+            except (socket.error, httplib.HTTPException) as e:
+                self.send_error(502, str(e))
+                return
+            self.server.archive.add(key, status, headers, content)
+        else:
+            response = self.server.archive.next(key)
+            if response is None:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.send_header('X-Replay-Missing', key)
+                self.end_headers()
+                return
+            status, headers, content = response
+
+        content = self.server.rewrite_body(headers, content)
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, self.server.rewrite_header(name, value))
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = do_PATCH = \
+            do_OPTIONS = handle_any
+
+    def fetch(self, url, body):
+        """ Makes a request upstream, returning ``(status, headers, body)``.
+        """
+        parts = urlparse.urlsplit(url)
+        connection_class = (httplib.HTTPSConnection if parts.scheme == 'https'
+                else httplib.HTTPConnection)
+        connection = connection_class(parts.netloc, timeout=60)
+        headers = dict((name, value) for name, value in self.headers.items()
+                if name.lower() not in HOP_HEADERS)
+        headers['host'] = parts.netloc
+        # plain bodies, so they can be rewritten
+        headers['accept-encoding'] = 'identity'
+        for name in ('origin', 'referer'):
+            if name in headers:
+                headers[name] = self.server.unrewrite(headers[name])
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        try:
+            connection.request(self.command, path, body or None, headers)
+            response = connection.getresponse()
+            content = response.read()
+        finally:
+            connection.close()
+        headers = [(name, value) for name, value in response.getheaders()
+                if name.lower() not in HOP_HEADERS]
+        # getheaders() joins repeated headers with commas, which breaks cookies
+        headers = [(name, value) for name, value in headers
+                if name.lower() != 'set-cookie']
+        headers += [('Set-Cookie', value) for value in
+                response.msg.getheaders('set-cookie')]
+        return response.status, headers, content
+
+
+class ProxyServer(ThreadingMixIn, HTTPServer):
+    """ Records or replays HTTP exchanges, as the site itself or as a proxy.
+
+        :param Archive archive: Archive to record to or replay from
+        :param str mode: ``record`` or ``replay``
+        :param str upstream: The real site, like ``http://about.me``
+        :param int port: Port to listen on (default: any free one)
+        :param list ignore: Parameters left out of request keys (default:
+            :data:`IGNORED_PARAMS`)
+
+    """
+    daemon_threads = True
+
+    def __init__(self, archive, mode, upstream, host='127.0.0.1', port=0,
+            ignore=IGNORED_PARAMS):
+        HTTPServer.__init__(self, (host, port), _Handler)
+        self.archive = archive
+        self.mode = mode
+        self.ignore = ignore
+        self.upstream = upstream.rstrip('/')
+        self.upstream_host = urlparse.urlsplit(self.upstream).netloc
+        # scheme-relative and absolute URLs of the site, and cookie domains
+        self._site_url = re.compile(r'(?:https?:)?//(?:www\.)?%s(?![\w.-])'
+                % re.escape(self.upstream_host))
+        self._cookie_domain = re.compile(r';\s*domain=[^;]*', re.I)
+
+    @property
+    def domain(self):
+        """ What ``DOMAIN_NAME`` should be to use the server as the site. """
+        return '%s:%d' % self.server_address
+
+    def rewrite_header(self, name, value):
+        name = name.lower()
+        if name == 'location':
+            return self._site_url.sub('http://' + self.domain, value)
+        if name == 'set-cookie':
+            value = self._cookie_domain.sub('', value)
+            return re.sub(r';\s*secure(?=;|$)', '', value, flags=re.I)
+        return value
+
+    def rewrite_body(self, headers, body):
+        content_type = dict((n.lower(), v) for n, v in headers).get(
+                'content-type', '')
+        if not content_type.startswith(TEXT_TYPES):
+            return body
+        return self._site_url.sub('http://' + self.domain, body)
+
+    def unrewrite(self, url):
+        """ Turns a URL pointing at the server back into one for the site. """
+        return url.replace('http://' + self.domain, self.upstream)
+
+    def start(self):
+        """ Serves in a background thread, saving the archive every
+            :data:`SAVE_INTERVAL` seconds when recording.
+        """
+        self._stopped = threading.Event()
+        targets = [self.serve_forever]
+        if self.mode == 'record':
+            targets.append(self._save_regularly)
+        for target in targets:
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def _save_regularly(self):
+        # so a run that is killed still leaves most of what it recorded
+        while not self._stopped.wait(SAVE_INTERVAL):
+            self.archive.save()
+
+    def stop(self):
+        """ Stops serving, and saves the archive when recording. """
+        if getattr(self, '_stopped', None):
+            self._stopped.set()
+        self.shutdown()
+        self.server_close()
+        if self.mode == 'record':
+            self.archive.save()
+
+
+def start(path, mode='replay', upstream='http://about.me', port=0,
+        ignore=IGNORED_PARAMS):
+    """ Starts a :class:`ProxyServer` in the background.
+
+        :param str path: Archive file
+        :param list ignore: Parameters left out of request keys
+        :returns: The running server; its :attr:`ProxyServer.domain` goes in
+            ``DOMAIN_NAME`` and ``get_browser(proxy=...)``
+    """
+    if mode not in ('record', 'replay'):
+        raise ValueError('mode must be record or replay, not %r' % mode)
+    return ProxyServer(Archive(path), mode, upstream, port=port,
+            ignore=ignore).start()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Record or replay the HTTP traffic of test runs.')
+    parser.add_argument('mode', choices=['record', 'replay'])
+    parser.add_argument('archive', help='archive file')
+    parser.add_argument('--upstream', default='http://about.me',
+            help='the real site (default: http://about.me)')
+    parser.add_argument('--port', type=int, default=8081)
+    args = parser.parse_args()
+
+    server = ProxyServer(Archive(args.archive), args.mode, args.upstream,
+            port=args.port)
+    print "%sing %s on %s; use DOMAIN_NAME=%s" % (args.mode.rstrip('e'),
+            args.upstream, server.domain, server.domain)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.mode == 'record':
+            server.archive.save()
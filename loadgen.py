@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Load generation from the test journeys.
+
+Runs a module's numbered tests, in order, as one user's journey (say log in,
+then create, view and delete a spotlight) in several headless browsers at
+once, over and over for a number of iterations or a length of time. Each
+session logs the server latency, from request sent to first byte back, of
+every :meth:`utils.Browser.go` and :meth:`utils.Browser.wait_for_save`, and
+the percentiles are reported per URL path at the end.
+
+Point it at a local stand-in server with ``domain``::
+
+    >>> import loadgen, test_spotlight_hireme
+    >>> loadgen.run_load(test_spotlight_hireme, sessions=5, duration=60,
+    ...         domain='127.0.0.1:8080')
+
+Or from the shell::
+
+    $ python loadgen.py test_spotlight_hireme --sessions 5 --duration 60 --domain 127.0.0.1:8080
+
+Sessions that log in lease accounts like any other test, so give the pool in
+``selenium_cfg.TEST_ACCOUNTS`` at least as many accounts as there are
+sessions, or they will take turns.
+
+"""
+import sys
+import time
+import argparse
+import threading
+import traceback
+from datetime import timedelta
+
+import utils
+
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(values, pct):
+    """ Returns the nearest-rank percentile of a sorted list. """
+    rank = max(int(round(pct / 100.0 * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def run_load(module, sessions=5, duration=None, iterations=None, initial=0,
+        through=99, browser='phantomjs', domain=None):
+    """ Runs a module's numbered tests as a journey in concurrent browsers
+        and prints latency percentiles.
+
+        :param module: Module to take the tests from
+        :param int sessions: Number of concurrent browsers
+        :param int duration: Seconds to keep starting journeys for (optional)
+        :param int iterations: Journeys per session (default: 1 without a
+            duration)
+        :param int initial: Number of the first test of the journey
+        :param int through: Number of the last test of the journey
+        :param str browser: Browser to run (default: phantomjs)
+        :param str domain: Domain to run against, for this run only
+            (default: the usual ``DOMAIN_NAME``)
+        :returns: ``{(kind, path): {'count': n, 'p50': ms, ..., 'max': ms}}``
+            plus ``'journeys'`` and ``'errors'`` counts
+
+    """
+    utils.init()
+    default_domain = utils.DOMAIN_NAME
+    if domain:
+        utils.DOMAIN_NAME = domain
+    try:
+        return _run_load(module, sessions, duration, iterations, initial,
+                through, browser)
+    finally:
+        utils.DOMAIN_NAME = default_domain
+
+
+def _run_load(module, sessions, duration, iterations, initial, through,
+        browser):
+    if not duration and not iterations:
+        iterations = 1
+    deadline = duration and time.time() + duration
+
+    latency_log = []
+    counts = {'journeys': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def session(n):
+        b = utils.get_browser(browser, secondary=True)
+        b.latency_log = latency_log
+        try:
+            b.maximize()
+            done = 0
+            while ((not iterations or done < iterations)
+                    and (not deadline or time.time() < deadline)):
+                # a new TestClass per journey, as tests keep state on it
+                tests = utils.numbered_tests(utils.get_test_entity(module),
+                        initial, through)
+                b.delete_all_cookies()
+                try:
+                    for test in tests:
+                        test(b)
+                except Exception:
+                    with lock:
+                        counts['errors'] += 1
+                    print "session %d: %s" % (n, traceback.format_exc().splitlines()[-1])
+                    b.release_account()
+                done += 1
+                with lock:
+                    counts['journeys'] += 1
+        finally:
+            b.quit()
+
+    threads = [threading.Thread(target=session, args=(n,))
+            for n in range(sessions)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    by_label = {}
+    for kind, path, ms in list(latency_log):
+        by_label.setdefault((kind, path), []).append(ms)
+
+    report = dict(counts)
+    print "%d journeys (%d failed) in %d sessions over %s" % (
+            counts['journeys'], counts['errors'], sessions,
+            timedelta(seconds=int(elapsed)))
+    print "%-5s %-40s %6s %s %7s" % ('', 'path', 'count',
+            ' '.join('%7s' % ('p%d' % p) for p in PERCENTILES), 'max')
+    for (kind, path), values in sorted(by_label.items()):
+        values.sort()
+        stats = {'count': len(values), 'max': values[-1]}
+        for p in PERCENTILES:
+            stats['p%d' % p] = percentile(values, p)
+        report[(kind, path)] = stats
+        print "%-5s %-40s %6d %s %7d" % (kind, path, len(values),
+                ' '.join('%7d' % stats['p%d' % p] for p in PERCENTILES),
+                stats['max'])
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+            description='Run test journeys as load and report latencies.')
+    parser.add_argument('module', help='test module, like test_login')
+    parser.add_argument('--sessions', type=int, default=5)
+    parser.add_argument('--duration', type=int, help='in seconds')
+    parser.add_argument('--iterations', type=int)
+    parser.add_argument('--initial', type=int, default=0)
+    parser.add_argument('--through', type=int, default=99)
+    parser.add_argument('--browser', default='phantomjs')
+    parser.add_argument('--domain')
+    args = parser.parse_args()
+
+    report = run_load(__import__(args.module), sessions=args.sessions,
+            duration=args.duration, iterations=args.iterations,
+            initial=args.initial, through=args.through, browser=args.browser,
+            domain=args.domain)
+    sys.exit(1 if report['errors'] else 0)
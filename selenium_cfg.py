@@ -9,6 +9,65 @@ DOMAIN_NAME = 'about.me'
 #DOMAIN_NAME = 'staging.about.me'
 AJAX_SAVE_DELAY = 4 # in seconds
 
+# Accounts that can stand in for each test user. Browser.login('justa_tester')
+# leases whichever one is free so parallel runs never share an account. They
+# should all look alike to the tests (same display name, etc).
+TEST_ACCOUNTS = {
+    'justa_tester': [('justa_tester', 'testing1')],
+}
+#ACCOUNT_LOCK_DIR = '/tmp/selenium_accounts'
+ACCOUNT_LEASE_TIMEOUT = 5 * 60 # in seconds
+
+# Browsers used by utils.run_browser_matrix and how long each gets
+SELENIUM_MATRIX_BROWSERS = ['firefox', 'chrome', 'phantomjs']
+SELENIUM_MATRIX_TIMEOUT = 30 * 60 # in seconds
+
+# Browsers are swapped for a fresh one (keeping URL and cookies) after this
+# many tests, or once their processes use this much memory. None disables.
+SELENIUM_RECYCLE_AFTER = 100
+SELENIUM_RECYCLE_RSS_MB = 1500
+# Seconds a test, and a whole module run by utils.run_numbered_tests, may
+# take before the test is aborted and its browser killed. None means no limit.
+SELENIUM_TEST_DEADLINE = None # like 10 * 60
+SELENIUM_MODULE_DEADLINE = None
+# Where pids of started browsers are kept so orphans can be killed later
+#SELENIUM_PID_DIR = '/tmp/selenium_pids'
+
+# utils.run_numbered_tests saves the browser's state after every passing test
+# so a run with initial=N can start from where test N-1 left off. They hold
+# session cookies, so only turn them on where that's fine.
+SELENIUM_CHECKPOINTS = False
+#SELENIUM_CHECKPOINT_DIR = './.checkpoints' # kept per browser and module
+
+# Browser.assert_visual baselines, and how different a screenshot may be.
+# Tolerance is per pixel channel (0-255), max diff is a share of all pixels.
+VISUAL_BASELINE_DIR = './visual_baselines'
+VISUAL_TOLERANCE = 16
+VISUAL_MAX_DIFF = 0.001
+
+# Site that SELENIUM_HTTP_RECORD runs record from (see httpreplay.py). The
+# default is http:// plus DOMAIN_NAME.
+#HTTP_ARCHIVE_UPSTREAM = 'https://staging.about.me'
+# Query and body parameters that change every run and so are left out when
+# matching requests, see httpreplay.IGNORED_PARAMS
+#HTTP_ARCHIVE_IGNORED_PARAMS = ('_', 'csrf_token')
+
+# Budgets checked by Browser.go() every time it loads one of these paths. See
+# Browser.assert_page_budget for the metrics (times are in ms).
+PAGE_BUDGETS = {
+    #'/': {'ttfb': 1000, 'load': 5000},
+}
+
+# Run firefox and chrome on virtual displays from a pool of Xvfb servers, so
+# several headed browsers can run side by side (see xvfb.py)
+SELENIUM_XVFB = False
+XVFB_MAX_DISPLAYS = 4
+#XVFB_PATH = '/usr/bin/Xvfb'
+
+# Turn off CSS transitions/animations, jQuery effects and smooth scrolling on
+# every page so tests don't wait for them (see Browser.animations_disabled)
+SELENIUM_DISABLE_ANIMATIONS = False
+
 # Where to put the selenium window that spawns
 SELENIUM_SCREENSHOTS = False
 #SELENIUM_DELAY = 1
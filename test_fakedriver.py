@@ -0,0 +1,471 @@
+# -*- coding: utf-8 -*-
+"""
+Test the helpers against the fake driver, so they can run in CI without a
+browser or a site to test
+
+to run this test in ipython:
+navigate to this directory
+open ipython and type the following 3 commands:
+    import utils
+    import test_fakedriver
+    b = utils.run_numbered_tests(test_fakedriver)
+
+Besides the browser helpers it covers what runs around the tests: account
+leases, the process governor, Xvfb displays (with a stand-in for Xvfb),
+the coordinator, load generation and the HTTP archive.
+"""
+
+import os
+import re
+import sys
+import time
+import types
+import shutil
+import urllib2
+import tempfile
+import threading
+import subprocess
+from contextlib import contextmanager
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from selenium.common.exceptions import TimeoutException
+
+import utils
+import xvfb
+import loadgen
+import accounts
+import governor
+import fakedriver
+import httpreplay
+import coordinator
+import selenium_cfg
+from utils import *
+
+
+# run in the fake whatever the configured browser is
+SELENIUM_BROWSER = 'fake'
+
+PAGES = {
+    '/profile': """<html><head><title>Profile</title></head><body>
+        <div class="notification banner">Saved</div>
+        <p class="quote">Don't say "never"</p>
+        <div class="skills">
+            <span>Python</span>
+            <input class="tag" value="one"><input class="tag" value="two">
+        </div>
+        <div class="languages">
+            <span>Rust</span>
+            <input class="tag" value="three">
+        </div>
+        <div class="welcome" style="display: none">Welcome</div>
+        <a href="/settings">Settings</a>
+        </body></html>""",
+    '/settings': """<html><head><title>Settings</title></head><body>
+        <h1>Settings</h1>
+        </body></html>""",
+    '/login': """<html><head><title>Log in</title></head><body>
+        <input id="login"><input id="password">
+        <button value="submit">Log in</button>
+        </body></html>""",
+}
+
+# Stands in for Xvfb: reports a display number on -displayfd, then idles
+FAKE_XVFB = """import os, sys, time
+fd = int(sys.argv[sys.argv.index('-displayfd') + 1])
+os.write(fd, '%d\\n' % (os.getpid() % 1000 + 100))
+time.sleep(60)
+"""
+
+
+@contextmanager
+def configured(**settings):
+    """ Sets ``selenium_cfg`` values for the length of a ``with`` block. """
+    missing = object()
+    saved = dict((name, getattr(selenium_cfg, name, missing))
+            for name in settings)
+    for name, value in settings.items():
+        setattr(selenium_cfg, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is missing:
+                delattr(selenium_cfg, name)
+            else:
+                setattr(selenium_cfg, name, value)
+
+
+class Upstream(BaseHTTPRequestHandler):
+    """ A site for the HTTP archive to record, answering every request with
+        its path and how many requests came before it.
+    """
+    hits = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        Upstream.hits += 1
+        body = '%s #%d' % (self.path, Upstream.hits)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestClass:
+
+    @classmethod
+    def setup_class(cls):
+        fakedriver.PAGES.update(PAGES)
+        cls.temp_dir = tempfile.mkdtemp()
+
+    @autobrowser
+    def test_00_setup(b, cls):
+        b.go('/profile')
+        assert b.title == 'Profile'
+
+    # text with both kinds of quotes
+
+    @autobrowser
+    def test_01_contains(b, cls):
+        assert b.contains('Don\'t say "never"', 'p').get_attribute('class') == 'quote'
+        assert b.contains('Python', 'div').tag_name == 'span'
+        assert b.not_contains('Welcome')
+        assert b.not_contains('Perl', wait=0)
+
+    @autobrowser
+    def test_02_within(b, cls):
+        with b.within('.skills') as skills:
+            assert b.scope == skills
+            assert b.contains('Python')
+            assert b.not_contains('Rust', wait=0)
+            assert len(b.find_elements_by_xpath('//input')) == 2
+            assert b('input.tag').get_attribute('value') == 'one'
+            # nested blocks search the enclosing block's element
+            with b.within('span') as span:
+                assert span.text == 'Python'
+                assert b.contains('Python') == span
+        assert b.scope is None
+        assert b.contains('Rust')
+        assert len(b.find_elements_by_css_selector('input.tag')) == 3
+
+    @autobrowser
+    def test_03_conditions(b, cls):
+        b.assert_banner_text('Saved')
+        assert b.wait(1, conditions.present('.languages input')).get_attribute('value') == 'three'
+        assert b.wait(1, conditions.removed('.dialog'))
+        with b.within('.languages'):
+            assert b.wait(1, conditions.text('Rust'))
+
+        try:
+            b.wait(0.2, conditions.visible('.welcome'))
+        except TimeoutException:
+            pass
+        else:
+            raise TestFailure('.welcome is hidden')
+
+        orig_url = b.current_url
+        b.contains('Settings', 'a').click()
+        b.wait(1, conditions.url_changes(orig_url))
+        assert b.current_url.endswith('/settings')
+
+    @autobrowser
+    def test_04_checkpoint(b, cls):
+        b.go('/profile')
+        b.add_cookie({'name': 'session', 'value': 'checkpointed'})
+        module = sys.modules[__name__]
+        utils.save_checkpoint(b, module, 4)
+
+        # saved against another site
+        domain, utils.DOMAIN_NAME = utils.DOMAIN_NAME, 'elsewhere.com'
+        try:
+            assert utils.restore_checkpoint(module, 5) is None
+        finally:
+            utils.DOMAIN_NAME = domain
+        assert utils.CURRENT_BROWSER is b
+
+        # a cookie the browser won't take back is left out
+        session = b.get_session()
+        session['cookies'].append({'name': 'other', 'value': 'x',
+                'domain': '.elsewhere.com'})
+        b.restore_session(session)
+        assert b.get_cookie('other') is None
+        assert b.get_cookie('session')['value'] == 'checkpointed'
+
+        assert utils.restore_checkpoint(module, 5) == 4
+        restored = utils.CURRENT_BROWSER
+        assert restored is not b
+        assert restored.current_url.endswith('/profile')
+        assert restored.get_cookie('session')['value'] == 'checkpointed'
+
+    @responsive(1000, 320)
+    @autobrowser
+    def test_05_responsive(b, cls):
+        # each width gets its own browser, picking up the session
+        assert b.window_width in (1000, 320)
+        assert b.get_window_size()['width'] == b.window_width
+        assert b.current_url.endswith('/profile')
+        assert b.get_cookie('session')['value'] == 'checkpointed'
+
+    # pages reached by a click, then searched with plain finders
+
+    @autobrowser
+    def test_06_animations(b, cls):
+        b.animations_disabled = True
+        turned_off = []
+        b.command_executor.on_script('selenium-no-animations',
+                lambda conn, args: turned_off.append(conn.url))
+        b.go('/profile')
+        b('a').click()
+        assert b('h1').text == 'Settings'
+        assert b.find('h1') and b.css_selector('h1')
+        assert [url for url in turned_off if url.endswith('/settings')] == [
+                b.current_url]
+
+    # a replayed session fails loudly once it strays from the recording
+
+    @autobrowser
+    def test_07_replay(b, cls):
+        path = os.path.join(cls.temp_dir, 'session.jsonl')
+        recorded = utils.Browser(fakedriver.record(fakedriver.fake_driver(), path))
+        recorded.go('/profile')
+        title = recorded.title
+        recorded.quit()
+
+        replayed = utils.Browser(fakedriver.replay_driver(path))
+        replayed.go('/profile')
+        assert replayed.title == title
+        try:
+            replayed.find_element_by_css_selector('.quote')
+        except fakedriver.ReplayDiverged as e:
+            assert 'recorded quit, got findElement' in str(e)
+        else:
+            raise TestFailure('the replay went on past the recording')
+
+    # a test stuck past its deadline is aborted
+
+    @autobrowser
+    def test_08_watchdog(b, cls):
+        @autobrowser(deadline=0.5)
+        def stuck(b):
+            while True:
+                b.title
+
+        browser = get_browser('fake', secondary=True)
+        errors = []
+        def run():
+            try:
+                stuck(browser)
+            except TestTimeout as e:
+                errors.append(e)
+        # a thread of its own, so a deadline of this test doesn't cover it
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        thread.join(utils.ARTIFACT_TIMEOUT + 10)
+        try:
+            assert not thread.is_alive(), 'the watchdog never went off'
+            assert errors and 'ran past its 0.5s deadline' in str(errors[0])
+        finally:
+            for path in re.findall(r'\[(.+?)\]', str(errors and errors[0])):
+                os.remove(path)
+            try:
+                browser.quit()
+            except Exception:
+                # its session was ended by the watchdog
+                pass
+
+    # only one test at a time gets an account of a pool
+
+    @autobrowser
+    def test_09_accounts(b, cls):
+        with configured(TEST_ACCOUNTS={'tester': [('tester_1', 'secret')]},
+                ACCOUNT_LOCK_DIR=cls.temp_dir):
+            b.login('tester')
+            try:
+                assert (b.username, b.password) == ('tester_1', 'secret')
+                try:
+                    accounts.lease_account('tester', timeout=0.5)
+                except accounts.LeaseTimeout:
+                    pass
+                else:
+                    raise TestFailure('tester_1 was leased twice')
+            finally:
+                b.release_account()
+            accounts.lease_account('tester', timeout=0).release()
+
+    # what a test process that died left running is killed by the next one
+
+    def test_10_governor(self):
+        pid_dir = os.path.join(self.temp_dir, 'pids')
+        if not governor._process_tree(os.getpid()):
+            print "  skipped, no /proc or psutil to track processes with"
+            return
+        orphan = subprocess.Popen(['sleep', '60'])
+        owner = subprocess.Popen([sys.executable, '-c',
+                'import sys, time, governor\n'
+                'governor.ResourceGovernor(sys.argv[1]).track_process(int(sys.argv[2]))\n'
+                'print "tracked"\n'
+                'sys.stdout.flush()\n'
+                'time.sleep(60)', pid_dir, str(orphan.pid)],
+                cwd=selenium_cfg.HERE, stdout=subprocess.PIPE)
+        try:
+            assert owner.stdout.readline().strip() == 'tracked'
+            owner.kill()
+            owner.wait()
+            governor.ResourceGovernor(pid_dir).reap_orphans()
+            for _ in range(20):
+                if orphan.poll() is not None:
+                    break
+                time.sleep(0.1)
+            assert orphan.returncode == -9
+            assert not os.listdir(pid_dir)
+        finally:
+            for process in (orphan, owner):
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+
+        recycler = governor.ResourceGovernor(pid_dir, recycle_after=2)
+        browser = get_browser('fake', secondary=True)
+        try:
+            recycler.count_test(browser)
+            assert not recycler.should_recycle(browser)
+            recycler.count_test(browser)
+            assert recycler.should_recycle(browser)
+        finally:
+            browser.quit()
+
+    # displays are reused, limited, restarted, and killed by the governor
+
+    def test_11_xvfb(self):
+        path = os.path.join(self.temp_dir, 'Xvfb')
+        with open(path, 'w') as f:
+            f.write('#!%s\n%s' % (sys.executable, FAKE_XVFB))
+        os.chmod(path, 0755)
+        tracker = governor.ResourceGovernor(os.path.join(self.temp_dir, 'xpids'))
+        pool = xvfb.DisplayPool((800, 600), max_displays=1, xvfb=path,
+                governor=tracker)
+        try:
+            lease = pool.lease()
+            assert re.match(r'^:\d+$', lease.name)
+            try:
+                pool.lease(timeout=0.2)
+            except xvfb.XvfbError:
+                pass
+            else:
+                raise TestFailure('more displays than max_displays')
+            lease.release()
+            again = pool.lease()
+            assert again.process is lease.process
+
+            xvfb._stop(again.process)
+            again.release()
+            restarted = pool.lease()
+            assert restarted.process is not lease.process and restarted.alive()
+
+            if governor._process_tree(os.getpid()):
+                # like the test process dying without shutting the pool down
+                tracker.shutdown()
+                restarted.process.wait()
+                assert not restarted.alive()
+        finally:
+            pool.shutdown()
+
+    # items go to whoever pulls, and back on the queue if a worker goes quiet
+
+    def test_12_coordinator(self):
+        queue = coordinator.Coordinator(['test_login', 'test_fakedriver:3-4'],
+                heartbeat_timeout=0.2)
+        first = queue.pull('one')['item']
+        second = queue.pull('two')['item']
+        assert (first['module'], first['initial'], first['through']) == (
+                'test_login', 0, 99)
+        assert (second['module'], second['initial'], second['through']) == (
+                'test_fakedriver', 3, 4)
+        assert queue.pull('three') == {'status': 'wait'}
+
+        assert queue.lease_account(first['id'], ['a', 'b']) == 'a'
+        assert queue.lease_account(second['id'], ['a', 'b']) == 'b'
+        assert queue.lease_account(second['id'], ['a']) is None
+
+        assert queue.stream('two', second['id'], 'Running test_03\n')
+        assert queue.report('two', second['id'], True, [['test_03', None]])
+        assert queue.results[second['id']]['output'] == 'Running test_03\n'
+
+        # one stops heartbeating, and its item and account go to three
+        time.sleep(0.3)
+        assert queue.pull('three')['item'] == first
+        assert not queue.stream('one', first['id'], 'too late\n')
+        assert queue.lease_account(first['id'], ['a']) == 'a'
+        assert queue.report('three', first['id'], False, [['test_00', 'boom']])
+        assert queue.finished.is_set()
+        assert queue.pull('one') == {'status': 'done'}
+
+    # journeys run side by side, failures counted rather than raised
+
+    def test_13_loadgen(self):
+        journey = types.ModuleType('journey')
+        class TestClass:
+            def test_00_profile(self, b):
+                b.go('/profile')
+                assert b.title == 'Profile'
+            def test_01_settings(self, b):
+                b.go('/settings')
+                b('h1')
+        journey.TestClass = TestClass
+        domain = utils.DOMAIN_NAME
+        report = loadgen.run_load(journey, sessions=2, iterations=3,
+                browser='fake', domain='load.example.com')
+        assert (report['journeys'], report['errors']) == (6, 0)
+        assert utils.DOMAIN_NAME == domain
+
+        def test_01_settings(self, b):
+            raise TestFailure('no settings')
+        TestClass.test_01_settings = test_01_settings
+        report = loadgen.run_load(journey, sessions=2, iterations=1,
+                browser='fake')
+        assert (report['journeys'], report['errors']) == (2, 2)
+
+    # recorded responses come back in order, without the site
+
+    def test_14_http_archive(self):
+        site = HTTPServer(('127.0.0.1', 0), Upstream)
+        thread = threading.Thread(target=site.serve_forever)
+        thread.daemon = True
+        thread.start()
+        upstream = 'http://127.0.0.1:%d' % site.server_address[1]
+        path = os.path.join(self.temp_dir, 'archive.json')
+        fetch = lambda server, url: urllib2.urlopen(
+                'http://%s%s' % (server.domain, url)).read()
+
+        recorder = httpreplay.start(path, 'record', upstream)
+        try:
+            first = fetch(recorder, '/page?_=1')
+            second = fetch(recorder, '/page?_=2')
+        finally:
+            recorder.stop()
+            site.shutdown()
+        assert first != second
+
+        player = httpreplay.start(path, 'replay', upstream)
+        try:
+            # the cache buster is left out of the match
+            assert fetch(player, '/page?_=3') == first
+            assert fetch(player, '/page?_=4') == second
+            assert fetch(player, '/page?_=5') == second
+            try:
+                fetch(player, '/other')
+            except urllib2.HTTPError as e:
+                assert e.code == 404
+            else:
+                raise TestFailure('/other was never recorded')
+        finally:
+            player.stop()
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+        if utils.CURRENT_BROWSER:
+            utils.CURRENT_BROWSER.quit()
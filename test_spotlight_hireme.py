@@ -84,15 +84,17 @@ class TestClass:
         # wait for page change
         orig_url = b.current_url
         b.contains('Publish').click()
-        b.wait(lambda b: b.current_url != orig_url)
+        b.wait(conditions.url_changes(orig_url))
 
+    @responsive(1000, 320)
     @autobrowser
     def test_02_bar_display(b, cls):
-        b.breakpoint(1000)
-        assert b('.spotlight-banner').is_displayed()
-        b.breakpoint(320)
-        assert b.not_find('.spotlight-banner')
-        b.maximize()
+        # window_width is only known after a breakpoint(), and a browser
+        # passed in may not have had one
+        if b.get_window_size()['width'] >= 1000:
+            assert b('.spotlight-banner').is_displayed()
+        else:
+            assert b.not_find('.spotlight-banner')
 
     @autobrowser
     def test_03_view(b, cls):
@@ -128,7 +130,7 @@ class TestClass:
         # wait for page change
         orig_url = b.current_url
         b('.ui-dialog').contains('Delete').click()
-        b.wait(lambda b: b.current_url != orig_url)
+        b.wait(conditions.url_changes(orig_url))
 
         assert b.not_contains('hiremenow')
 
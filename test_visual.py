@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Test the screenshot comparison behind Browser.assert_visual, on made up
+images and the fake driver. Needs numpy and PIL; without them every test
+is skipped.
+
+to run this test in ipython:
+navigate to this directory
+open ipython and type the following 3 commands:
+    import utils
+    import test_visual
+    b = utils.run_numbered_tests(test_visual)
+"""
+
+import base64
+import shutil
+import tempfile
+from functools import wraps
+
+import utils
+import selenium_cfg
+from utils import *
+
+try:
+    import numpy
+    import visual
+except ImportError:
+    numpy = visual = None
+
+
+def needs_imaging(test):
+    @wraps(test)
+    def wrapper(*args, **kwargs):
+        if visual is None:
+            print "  skipped, numpy and PIL aren't installed"
+            return
+        return test(*args, **kwargs)
+    return wrapper
+
+
+def image(width, height, color=(255, 255, 255)):
+    pixels = numpy.zeros((height, width, 3), numpy.uint8)
+    pixels[:, :] = color
+    return pixels
+
+
+def baseline(pixels, mask=None):
+    """ Returns what visual.load_baseline() would for an image. """
+    png = visual.encode(pixels)
+    return (png, visual.decode(png), visual.dhash(pixels), mask)
+
+
+class TestClass:
+
+    @classmethod
+    def setup_class(cls):
+        cls.baseline_dir = tempfile.mkdtemp()
+        cls.configured_dir = getattr(selenium_cfg, 'VISUAL_BASELINE_DIR', None)
+        selenium_cfg.VISUAL_BASELINE_DIR = cls.baseline_dir
+
+    # identical, resized and slightly or badly changed screenshots
+
+    @needs_imaging
+    def test_01_compare(self):
+        pixels = image(40, 30)
+        base = baseline(pixels)
+        assert visual.compare(base[0], base) == (True, 'identical', None)
+
+        passed, message, diff = visual.compare(visual.encode(image(41, 30)), base)
+        assert not passed and 'size 41x30 differs from baseline 40x30' in message
+
+        noisy = pixels.copy()
+        noisy[10, 10] = (250, 250, 250)
+        passed, message, diff = visual.compare(visual.encode(noisy), base)
+        assert passed and diff is None
+
+        changed = pixels.copy()
+        changed[0:10, 0:10] = (0, 0, 0)
+        passed, message, diff = visual.compare(visual.encode(changed), base)
+        assert not passed
+        assert message.startswith('8.333% of pixels differ')
+        assert 'perceptual hash' in message
+        assert tuple(diff[5, 5]) == (255, 0, 0)
+        assert tuple(diff[20, 20]) == (85, 85, 85)
+
+    # more tolerance where the mask is gray, none where it is white
+
+    @needs_imaging
+    def test_02_masks(self):
+        pixels = image(40, 30)
+        changed = pixels.copy()
+        changed[0:10, 0:10] = (200, 200, 200)
+        png = visual.encode(changed)
+
+        mask = numpy.zeros((30, 40), numpy.uint8)
+        mask[0:10, 0:10] = 60
+        assert visual.compare(png, baseline(pixels, mask))[0]
+
+        mask[0:10, 0:10] = 40
+        assert not visual.compare(png, baseline(pixels, mask))[0]
+
+        changed[0:10, 0:10] = (0, 0, 0)
+        mask[0:10, 0:10] = 255
+        assert visual.compare(visual.encode(changed), baseline(pixels, mask))[0]
+
+        passed, message, diff = visual.compare(png,
+                baseline(pixels, numpy.zeros((20, 40), numpy.uint8)))
+        assert not passed
+        assert message == 'mask 40x20 differs from baseline 40x30'
+
+    # regions partly or wholly outside the screenshot
+
+    @needs_imaging
+    def test_03_crop(self):
+        pixels = image(100, 80, (0, 0, 0))
+        pixels[10:20, 30:50] = (255, 0, 0)
+        png = visual.encode(pixels)
+
+        region = visual.decode(visual.crop(png, [30, 10, 20, 10, 0, 0, 80, 1]))
+        assert region.shape == (10, 20, 3)
+        assert (region == (255, 0, 0)).all()
+
+        # scrolled, on a driver that captures the whole page
+        region = visual.decode(visual.crop(png, [30, 5, 20, 10, 0, 5, 40, 1]))
+        assert (region == (255, 0, 0)).all()
+
+        # high DPI
+        region = visual.decode(visual.crop(png, [15, 5, 10, 5, 0, 0, 40, 2]))
+        assert region.shape == (10, 20, 3)
+
+        region = visual.decode(visual.crop(png, [-10, -5, 20, 10, 0, 0, 80, 1]))
+        assert region.shape == (5, 10, 3)
+        region = visual.decode(visual.crop(png, [90, 75, 20, 10, 0, 0, 80, 1]))
+        assert region.shape == (5, 10, 3)
+
+        assert visual.crop(png, [0, 90, 20, 10, 0, 0, 80, 1]) is None
+        assert visual.crop(png, [-30, 0, 20, 10, 0, 0, 80, 1]) is None
+
+    # a baseline is saved the first time, then compared against
+
+    @needs_imaging
+    def test_04_assert_visual(self):
+        b = get_browser('fake')
+        try:
+            connection = b.command_executor
+            b.go('/')
+            screenshot = image(100, 80)
+            screenshot[10:20, 30:50] = (255, 0, 0)
+            connection.screenshot = base64.b64encode(visual.encode(screenshot))
+            scrolled = []
+            connection.on_script('getBoundingClientRect',
+                    lambda conn, args: [30, 10, 20, 10, 0, 0, 80, 1])
+            connection.on_script('scrollIntoView',
+                    lambda conn, args: scrolled.append(args[0]))
+
+            b.assert_visual('page')
+            b.assert_visual('page')
+            b.assert_visual('banner', region=b('body'))
+            assert len(scrolled) == 1
+
+            screenshot[10:20, 30:50] = (0, 0, 255)
+            connection.screenshot = base64.b64encode(visual.encode(screenshot))
+            b.assert_visual('page', max_diff=0.05)
+            try:
+                b.assert_visual('banner', region=b('body'))
+            except TestFailure as e:
+                assert '100.000% of pixels differ' in str(e)
+            else:
+                raise TestFailure('the banner changed color')
+        finally:
+            b.quit()
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.baseline_dir, ignore_errors=True)
+        selenium_cfg.VISUAL_BASELINE_DIR = cls.configured_dir
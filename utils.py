@@ -113,8 +113,20 @@ Here's some examples of shortcuts built into the :class:`Browser` wrapper::
 
 """
 import os
+import re
+import sys
+import copy
+import atexit
+import ctypes
+import json
 import time
+import errno
+import signal
 import logging
+import tempfile
+import threading
+import contextlib
+import subprocess
 import traceback
 import urllib
 import urlparse
@@ -124,17 +136,30 @@ import selenium
 import selenium.webdriver
 from selenium.webdriver import DesiredCapabilities, Firefox, Chrome, Ie, Remote
 from selenium.webdriver.support.wait import WebDriverWait
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.proxy import Proxy, ProxyType
+from selenium.webdriver.remote.command import Command
+from selenium.webdriver.remote.remote_connection import RemoteConnection
 from selenium.common.exceptions import (WebDriverException,
         NoSuchElementException, TimeoutException, ElementNotVisibleException,
         StaleElementReferenceException)
 
+import xvfb
+import accounts
+import httpreplay
+import conditions
+import fakedriver
 import selenium_cfg
+from governor import ResourceGovernor
 
 
 __all__ = [
         'TestFailure',
+        'TestTimeout',
         'autobrowser',
-        'get_browser'
+        'conditions',
+        'get_browser',
+        'responsive'
         ]
 
 # Default browser to launch with get_browser
@@ -142,15 +167,210 @@ SELENIUM_BROWSER = (os.getenv('SELENIUM_BROWSER')
         or getattr(selenium_cfg, 'SELENIUM_BROWSER', None)
         or 'firefox')
 
+# Window size set by Browser.maximize()
+WINDOW_SIZE = (1000, 800)
+
+# Browsers that can be given an Xvfb display by get_browser()
+HEADED_BROWSERS = ('firefox', 'chrome')
+
+# Seconds a test may take before its Watchdog aborts it, and seconds a whole
+# module run by run_numbered_tests may take. None means no limit.
+TEST_DEADLINE = getattr(selenium_cfg, 'SELENIUM_TEST_DEADLINE', None)
+MODULE_DEADLINE = getattr(selenium_cfg, 'SELENIUM_MODULE_DEADLINE', None)
+# Seconds a timed out browser gets to hand over a screenshot and its source
+ARTIFACT_TIMEOUT = 5
+# When the module run_numbered_tests is running has to be done by
+_module_deadline = None
+
+# Pool of Xvfb displays, started the first time one is needed
+DISPLAYS = None
+# Guards starting DISPLAYS
+_DISPLAY_LOCK = threading.Lock()
+
+# HTTP record/replay server standing in for the site, see start_http_archive()
+HTTP_ARCHIVE = None
+
 def get_domain_name():
+    if HTTP_ARCHIVE:
+        return HTTP_ARCHIVE.domain
     return (os.getenv('DOMAIN_NAME')
         or getattr(selenium_cfg, 'DOMAIN_NAME', None)
         or '127.0.0.1:8080')
+
+def start_http_archive():
+    """ Starts recording the run's HTTP traffic to the archive named by the
+        ``SELENIUM_HTTP_RECORD`` environment variable, or replaying it from
+        the one named by ``SELENIUM_HTTP_REPLAY``. See :mod:`httpreplay`.
+
+        :returns: The :class:`httpreplay.ProxyServer`, or None if neither
+            variable is set
+    """
+    for mode in ('record', 'replay'):
+        path = os.getenv('SELENIUM_HTTP_' + mode.upper())
+        if path:
+            upstream = (getattr(selenium_cfg, 'HTTP_ARCHIVE_UPSTREAM', None)
+                    or 'http://' + get_domain_name())
+            server = httpreplay.start(path, mode, upstream,
+                    ignore=getattr(selenium_cfg, 'HTTP_ARCHIVE_IGNORED_PARAMS',
+                        httpreplay.IGNORED_PARAMS))
+            atexit.register(server.stop)
+            return server
+    return None
+
 # Default domain
 DOMAIN_NAME = get_domain_name()
+# Whether init() ran
+_initialized = False
+
+def init():
+    """ Gets the process ready to run tests: kills what runs that died left
+        behind (see :meth:`governor.ResourceGovernor.reap_orphans`) and
+        starts the HTTP archive, if one was asked for (see
+        :func:`start_http_archive`).
+
+        Importing this module doesn't, so tools can import it without
+        touching other processes. :func:`run_numbered_tests`,
+        :func:`run_main` and :func:`run_browser_matrix` call it; only the
+        first call does anything.
+    """
+    global _initialized, HTTP_ARCHIVE, DOMAIN_NAME
+    if _initialized:
+        return
+    _initialized = True
+    GOVERNOR.reap_orphans()
+    HTTP_ARCHIVE = start_http_archive()
+    DOMAIN_NAME = get_domain_name()
 
 # @autobrowser instance
 CURRENT_BROWSER = None
+# Browser run_numbered_tests was told to run the tests in, see browser_for()
+_run_browser = None
+# Its replacement being launched ahead of time, see launch_browser()
+_launch = None
+
+# Tracks and cleans up the processes behind every browser we start
+GOVERNOR = ResourceGovernor()
+
+
+# Navigation and Resource Timing of the page just loaded, run as an async
+# script by go() and home(). Waits for the load event and, if arguments[0] is
+# true, for window.selenium_ready, for up to arguments[1] ms. Times are in ms
+# since the navigation started; ready is when selenium_ready was first seen.
+_PAGE_METRICS_SCRIPT = """
+var callback = arguments[arguments.length - 1];
+var waitReady = arguments[0], timeout = arguments[1];
+var perf = window.performance, t = perf.timing, started = new Date().getTime();
+var readyAt = null;
+
+function collect() {
+    var resources = perf.getEntriesByType ? perf.getEntriesByType('resource') : [];
+    var bytes = 0;
+    for (var i = 0; i < resources.length; i++) {
+        bytes += resources[i].transferSize || resources[i].encodedBodySize || 0;
+    }
+    callback({
+        url: window.location.href,
+        ttfb: t.responseStart - t.navigationStart,
+        server: t.responseStart - t.requestStart,
+        dom_content_loaded: t.domContentLoadedEventEnd - t.navigationStart,
+        load: t.loadEventEnd ? t.loadEventEnd - t.navigationStart : null,
+        ready: readyAt,
+        resources: resources.length,
+        bytes: bytes
+    });
+}
+
+(function check() {
+    var now = new Date().getTime();
+    if (readyAt === null && window.selenium_ready) {
+        readyAt = now - t.navigationStart;
+    }
+    if ((t.loadEventEnd && (readyAt !== null || !waitReady))
+            || now - started > timeout) {
+        return collect();
+    }
+    setTimeout(check, 10);
+})();
+"""
+
+# Run ahead of the page scripts of go(), home(), wait_until_ready() and of
+# waits on conditions (which contains() uses too) when
+# Browser.animations_disabled is set. On pages that don't set selenium_ready,
+# like production's, wait_until_ready() runs it by itself once per URL, so
+# pages reached by a click get it before the finders search them. Zero
+# length animations still fire their events, which transition: none wouldn't,
+# so pages waiting on them carry on.
+_NO_ANIMATIONS_SCRIPT = """
+try {
+    if (!document.getElementById('selenium-no-animations')) {
+        var style = document.createElement('style');
+        style.id = 'selenium-no-animations';
+        style.appendChild(document.createTextNode(
+            '*, *::before, *::after {' +
+            ' transition: none !important;' +
+            ' animation-duration: 0s !important;' +
+            ' animation-delay: 0s !important;' +
+            ' scroll-behavior: auto !important; }'));
+        (document.head || document.documentElement).appendChild(style);
+    }
+    if (window.jQuery) window.jQuery.fx.off = true;
+} catch (e) {}
+"""
+
+# localStorage and sessionStorage contents of the current page's origin, for
+# Browser.get_session(), and the script restore_session() puts them back with
+_GET_STORAGE_SCRIPT = """
+function dump(storage) {
+    var items = {};
+    for (var i = 0; i < storage.length; i++) {
+        var key = storage.key(i);
+        items[key] = storage.getItem(key);
+    }
+    return items;
+}
+try {
+    return {host: window.location.host, local: dump(window.localStorage),
+        session: dump(window.sessionStorage)};
+} catch (e) {
+    // pages like about:blank have no storage
+    return null;
+}
+"""
+
+_SET_STORAGE_SCRIPT = """
+var saved = arguments[0];
+var pairs = [[window.localStorage, saved.local],
+    [window.sessionStorage, saved.session]];
+for (var i = 0; i < pairs.length; i++) {
+    pairs[i][0].clear();
+    for (var key in pairs[i][1]) pairs[i][0].setItem(key, pairs[i][1][key]);
+}
+"""
+
+# Server time (request sent to first byte back) of the AJAX requests made
+# since the last time this ran. The resource timing buffer stops taking
+# entries once it's full (150 by default), so it's emptied after reading.
+_AJAX_LATENCY_SCRIPT = """
+var perf = window.performance, entries = perf.getEntriesByType('resource');
+var seen = window.__seleniumSeenResources || 0, latencies = [];
+if (seen > entries.length) {
+    // the page emptied it itself
+    seen = 0;
+}
+for (var i = seen; i < entries.length; i++) {
+    var e = entries[i];
+    if (e.initiatorType == 'xmlhttprequest' || e.initiatorType == 'fetch') {
+        latencies.push([e.name, e.responseStart - e.requestStart]);
+    }
+}
+if (perf.clearResourceTimings) {
+    perf.clearResourceTimings();
+    window.__seleniumSeenResources = 0;
+} else {
+    window.__seleniumSeenResources = entries.length;
+}
+return latencies;
+"""
 
 
 class TestFailure(WebDriverException):
@@ -158,6 +378,18 @@ class TestFailure(WebDriverException):
         for easy exception handling. """
 
 
+class TestTimeout(TestFailure):
+    """ Raised in a test that ran past its deadline. """
+
+
+class _DeadlinePassed(BaseException):
+    """ Raised in a test's thread by its :class:`Watchdog`. Not an Exception,
+        let alone a WebDriverException, so code that retries or waits out
+        driver errors lets it through; :func:`autobrowser` turns it into a
+        :class:`TestTimeout`.
+    """
+
+
 class Browser(object):
     """
     Helper class for :class:`selenium.webdriver.remote.WebDriver`.
@@ -195,6 +427,7 @@ class Browser(object):
     # These have to be available when __init__ runs since they are used in
     # __getattribute__
     _proxy_attrs = set()
+    _scopes = ()
 
     def __init__(self, driver):
         self.DOMAIN_NAME = DOMAIN_NAME
@@ -202,6 +435,8 @@ class Browser(object):
         self.username = None
         self.password = None
         self.email = None
+        self._account_lease = None
+        self._display_lease = None
 
         self._schema = 'http'
         if 'staging'.lower() in self.DOMAIN_NAME.lower():
@@ -211,6 +446,27 @@ class Browser(object):
         self._chrome_resized = False
         self._proxy_attrs = set()
 
+        # elements finds are limited to by within(), innermost last
+        self._scopes = []
+
+        # width set by the last maximize() or breakpoint() call
+        self.window_width = None
+
+        # (kind, label, ms) server latencies of go() and wait_for_save()
+        # calls get appended here when it's a list (see loadgen)
+        self.latency_log = None
+
+        # turn off CSS transitions and animations, jQuery effects and smooth
+        # scrolling on every page, so nothing has to be waited out
+        self.animations_disabled = getattr(selenium_cfg,
+                'SELENIUM_DISABLE_ANIMATIONS', False)
+        # page wait_until_ready() last turned them off on
+        self._animations_url = None
+
+        # timing metrics of every page loaded by go() or home(), by path
+        self.page_metrics = {}
+        self.last_page_metrics = None
+
         if callable(driver) and not isinstance(driver, Browser):
             self._driver = driver()
         elif isinstance(driver, Browser):
@@ -224,6 +480,8 @@ class Browser(object):
 
         # wait time to find an element
         self._driver.implicitly_wait(self.default_wait)
+        # so WebElement.contains() can wait as long as the browser does
+        self._driver._browser = self
 
         # set timeouts so tests don't hang forever
         self._driver.set_page_load_timeout(120)
@@ -241,13 +499,49 @@ class Browser(object):
                 self._proxy_attrs.add(attr)
 
     def __getattribute__(self, attr):
-        """ Proxy self._driver attributes onto the Browser instance. """
+        """ Proxy self._driver attributes onto the Browser instance. Find
+            methods search the element given to :meth:`within` instead while
+            in one.
+        """
         _get = lambda o,a: object.__getattribute__(o, a)
         if attr in _get(self, '_proxy_attrs'):
+            scopes = _get(self, '_scopes')
+            if scopes and attr.startswith('find_element'):
+                return _scoped_finder(scopes[-1], attr)
             return _get(_get(self, '_driver'), attr)
         else:
             return _get(self, attr)
 
+    @contextlib.contextmanager
+    def within(self, container):
+        """ Limits finds, :meth:`contains` and waits to the inside of an
+            element for the length of a ``with`` block::
+
+                with b.within('.skills'):
+                    b.contains('Python').click()
+                    b('input.tag').send_keys('Go')
+
+            :param container: CSS selector, found once when the block starts,
+                or a WebElement
+            :returns: The container element, for ``with ... as``
+
+            Blocks can be nested; selectors are found within the enclosing
+            block's element.
+
+        """
+        if isinstance(container, basestring):
+            container = self(container)
+        self._scopes.append(container)
+        try:
+            yield container
+        finally:
+            self._scopes.pop()
+
+    @property
+    def scope(self):
+        """ Element searches are limited to by :meth:`within`, or None. """
+        return self._scopes[-1] if self._scopes else None
+
     ### Shortcut methods ###
     def home(self, maximize=False):
         """ Goes to the homepage and maximizes the browser window. On Chrome,
@@ -260,15 +554,34 @@ class Browser(object):
         if maximize:
             self.maximize()
         self._driver.get(self._schema + '://' + self.DOMAIN_NAME)
+        self._record_page_metrics('/')
 
 
-    def login(self, username, password="testing1", came_from=None):
+    def login(self, username, password=None, came_from=None):
         """ Log a test user in.
 
             :param testing_user: TestingUser instance containing a username,
                 password and email to use
-            :param str password: The user's password (default: testing1)
+            :param str password: The user's password (default: testing1, or
+                the leased account's)
+
+            If ``username`` has a pool in ``selenium_cfg.TEST_ACCOUNTS`` an
+            account is leased from it instead (see :mod:`accounts`), and kept
+            until :meth:`release_account` or :meth:`quit` is called. A
+            password that is passed in is still used with it, so logging in
+            with a wrong one fails like it should.
         """
+        lease = self._account_lease
+        if not lease or lease.pool != username:
+            self.release_account()
+            lease = self._account_lease = accounts.lease_account(username)
+        if lease:
+            username = lease.username
+            if password is None:
+                password = lease.password
+        if password is None:
+            password = "testing1"
+
         if came_from:
             self.go('/login?came_from=' + came_from)
         else:
@@ -280,6 +593,12 @@ class Browser(object):
         self.password = password
         self.email = None
 
+    def release_account(self):
+        """ Gives a leased test account back to its pool. """
+        if self._account_lease:
+            self._account_lease.release()
+            self._account_lease = None
+
     def logout(self):
         """ Logs out the current user. """
         self.go('/logout_handler')
@@ -295,7 +614,85 @@ class Browser(object):
         """
         if not url.startswith('/'):
             url = '/' + url
-        return self._driver.get(self._schema + '://' + self.DOMAIN_NAME + url)
+        result = self._driver.get(self._schema + '://' + self.DOMAIN_NAME + url)
+        self._record_page_metrics(url)
+        return result
+
+    def _record_page_metrics(self, url):
+        """ Collects the timing metrics of the page just loaded into
+            :attr:`page_metrics` and checks them against the page's budget in
+            ``selenium_cfg.PAGE_BUDGETS``, if it has one.
+        """
+        path = urlparse.urlparse(url).path or '/'
+        wait_ready = self._sets_ready_flag(
+                self._schema + '://' + self.DOMAIN_NAME + path)
+        try:
+            metrics = self._driver.execute_async_script(
+                    self._with_page_setup(_PAGE_METRICS_SCRIPT), wait_ready, 5000)
+        except WebDriverException:
+            # no Navigation Timing support
+            metrics = None
+        if not isinstance(metrics, dict):
+            self.last_page_metrics = None
+            return
+        metrics['path'] = path
+        self.last_page_metrics = metrics
+        self.page_metrics.setdefault(path, []).append(metrics)
+
+        if self.latency_log is not None:
+            self.latency_log.append(('go', path, metrics['server']))
+        budget = getattr(selenium_cfg, 'PAGE_BUDGETS', {}).get(path)
+        if budget:
+            self.assert_page_budget(**budget)
+
+    def _with_page_setup(self, script):
+        """ Prefixes a script with what has to be done on every page, like
+            turning animations off, so it doesn't take a round trip of its
+            own.
+        """
+        if self.animations_disabled:
+            return _NO_ANIMATIONS_SCRIPT + script
+        return script
+
+    def assert_page_budget(self, **budget):
+        """ Asserts the page loaded last by :meth:`go` or :meth:`home` stayed
+            within a budget. ::
+
+                >>> b.go('/edit/spotlight')
+                >>> b.assert_page_budget(ttfb=800, load=4000, bytes=2 * 1024 * 1024)
+
+            :param budget: Most a metric may be, for any of ``ttfb``,
+                ``server``, ``dom_content_loaded``, ``load`` and ``ready``
+                (in ms), ``resources`` and ``bytes``
+            :raises: TestFailure
+
+        """
+        metrics = self.last_page_metrics
+        if metrics is None:
+            raise TestFailure('No page metrics to check the budget against')
+        over = []
+        for name, limit in sorted(budget.items()):
+            if name not in metrics:
+                raise TypeError('Unknown page metric %r' % name)
+            value = metrics[name]
+            if value is None or value > limit:
+                over.append('%s %s > %s' % (name,
+                    'never' if value is None else value, limit))
+        if over:
+            raise TestFailure('%s is over budget: %s' % (metrics['path'],
+                ', '.join(over)))
+
+    def _log_latencies(self, kind, script):
+        """ Appends ``(kind, URL path, ms)`` to the latency log for each
+            ``[URL, ms]`` pair a script returns.
+        """
+        try:
+            latencies = self._driver.execute_script(script) or []
+        except WebDriverException:
+            # no Navigation/Resource Timing support
+            return
+        for url, ms in latencies:
+            self.latency_log.append((kind, urlparse.urlparse(url).path or '/', ms))
 
     def wait(self, *args):
         """ Shortcut for waiting for an element's presence.
@@ -313,6 +710,8 @@ class Browser(object):
                 browser.wait(lambda b: b.find('#id'))
                 browser('#id')
 
+                # Checked inside the page, see the conditions module
+                browser.wait(conditions.present('#id'))
 
         """
         if len(args) > 2:
@@ -327,6 +726,15 @@ class Browser(object):
             if callable(arg):
                 until = arg
 
+        if isinstance(until, conditions.Condition):
+            if self._scopes and until.root is None:
+                until.root = self._scopes[-1]
+                try:
+                    return wait_in_page(self._driver, secs, until, self)
+                finally:
+                    until.root = None
+            return wait_in_page(self._driver, secs, until, self)
+
         if until:
             # until = lambda b: until(Browser(b))
             return WebDriverWait(self, secs).until(until)
@@ -334,7 +742,6 @@ class Browser(object):
         return WebDriverWait(self._driver, secs)
 
 
-
     def retry_loop(self,counter,retry_hook=None):
         """ Try generic loop trying function.  Will only catch and retry after
             exceptions of type WebDriverException, TimeoutException or AssertionError
@@ -364,11 +771,7 @@ class Browser(object):
         return method(val)
 
     def assert_banner_text(self, text):
-        def _banner_check(b):
-            element = b.css_selector('.notification.banner')
-            return text in element.text
-
-        self.wait(lambda b: _banner_check(b))
+        self.wait(conditions.text(text, '.notification.banner'))
 
     def wait_for_save(self):
         time.sleep(selenium_cfg.AJAX_SAVE_DELAY)
@@ -376,14 +779,14 @@ class Browser(object):
             val = b.execute_script('return jQuery.active')
             return val == 0
         self.wait(ajax_inactive)
+        if self.latency_log is not None:
+            self._log_latencies('ajax', _AJAX_LATENCY_SCRIPT)
 
     def dismiss_welcome_modal(self):
         """ Get rid of the welcome modal so other things can be clicked
         """
-        self.wait(lambda self: self.css_selector('.ui-dialog.welcome a.ui-dialog-titlebar-close').is_displayed())
-        self.css_selector_wait('.ui-dialog.welcome a.ui-dialog-titlebar-close').click()
-        self.wait(lambda self: self.css_selector('#profile_box .tooltip-close').is_displayed())
-        self.css_selector_wait('#profile_box .tooltip-close').click()
+        self.wait(conditions.visible('.ui-dialog.welcome a.ui-dialog-titlebar-close')).click()
+        self.wait(conditions.visible('#profile_box .tooltip-close')).click()
 
 
     def contains(self, text, tag='*'):
@@ -391,19 +794,22 @@ class Browser(object):
 
             :param str text: Text to look for
             :param str tag: Tag type to look for (default: \*)
-            :returns: WebElement if found, otherwise None
+            :returns: WebElement if found
+            :raises: NoSuchElementException
 
-        """
-        def _do_it():
-            try:
-                return self.xpath("""//%s[contains(text(),"%s")]""" % (tag, text))
-            except NoSuchElementException:
-                # maybe the text is in a child tag
-                if (tag != '*'):
-                    return self.xpath("""//%s//*[contains(text(),"%s")]""" % (tag, text))
-                raise
+            If no ``tag`` element has the text itself, an element inside one
+            that does is returned. Waits up to :attr:`default_wait` seconds
+            for the text to show up, using the page's text index (see
+            :data:`conditions.TEXT_INDEX`).
 
-        return self.retry_loop(2, _do_it)
+        """
+        self.wait_until_ready()
+        try:
+            return self.wait(self.default_wait,
+                    conditions.element_with_text(text, tag, nested=True))
+        except TimeoutException:
+            raise NoSuchElementException('No %s element contains %r'
+                    % (tag, text))
 
     def not_contains(self, text, tag='*', wait=1):
         """ Returns True if the element is not on the page
@@ -411,20 +817,16 @@ class Browser(object):
 
             :param str text: Text to look for
             :param str tag: Tag type to look for (default: \*)
-            :returns: WebElement if found, otherwise None
+            :param int wait: Seconds to give the text to show up (default: 1)
+            :returns: True if no displayed element has the text, else False
 
         """
-        absent = False
-        default_wait = self.default_wait
-        self.default_wait = wait
+        self.wait_until_ready()
         try:
-            absent = not self.xpath("""//%s[text()[contains(.,"%s")]]""" % (tag, text)).is_displayed()
-        except NoSuchElementException:
-            absent = True
-        finally:
-            self.default_wait = default_wait
-
-        return absent
+            element = self.wait(wait, conditions.element_with_text(text, tag))
+        except TimeoutException:
+            return True
+        return not element.is_displayed()
 
 
     def not_find(self, selector, wait=1):
@@ -451,7 +853,8 @@ class Browser(object):
     def maximize(self):
         """ Maximize the browser's window """
         #self._driver.set_window_size(2650, 1900)
-        self._driver.set_window_size(1000, 800)
+        self._driver.set_window_size(*WINDOW_SIZE)
+        self.window_width = WINDOW_SIZE[0]
         if getattr(selenium_cfg, 'SELENIUM_WINDOW_POSITION_X', False):
             x = getattr(selenium_cfg, 'SELENIUM_WINDOW_POSITION_X', 0)
             y = getattr(selenium_cfg, 'SELENIUM_WINDOW_POSITION_Y', 0)
@@ -461,12 +864,132 @@ class Browser(object):
 
     def breakpoint(self, width):
         """ Set window size to any width breakpoint """
-        self._driver.set_window_size(width, 800)
+        self._driver.set_window_size(width, WINDOW_SIZE[1])
+        self.window_width = width
         if getattr(selenium_cfg, 'SELENIUM_WINDOW_POSITION_X', False):
             x = getattr(selenium_cfg, 'SELENIUM_WINDOW_POSITION_X', 0)
             y = getattr(selenium_cfg, 'SELENIUM_WINDOW_POSITION_Y', 0)
             self._driver.set_window_position(x, y)
 
+    def assert_visual(self, name, region=None, tolerance=None, max_diff=None):
+        """ Asserts the page, or part of it, looks like its baseline
+            screenshot. See :mod:`visual` for how they are compared.
+
+            :param str name: Baseline name, unique for the browser type
+            :param region: CSS selector or WebElement to compare instead of
+                the whole window (optional)
+            :param int tolerance: Channel difference (0-255) allowed per pixel
+                (default: ``selenium_cfg.VISUAL_TOLERANCE``)
+            :param float max_diff: Share of pixels allowed to differ
+                (default: ``selenium_cfg.VISUAL_MAX_DIFF``)
+            :raises: TestFailure
+
+            Baselines live in ``selenium_cfg.VISUAL_BASELINE_DIR``. If there
+            isn't one yet, or the ``SELENIUM_UPDATE_BASELINES`` environment
+            variable is ``true``, the screenshot is saved as the baseline.
+
+        """
+        import visual
+
+        if tolerance is None:
+            tolerance = getattr(selenium_cfg, 'VISUAL_TOLERANCE', 16)
+        if max_diff is None:
+            max_diff = getattr(selenium_cfg, 'VISUAL_MAX_DIFF', 0.001)
+        baseline_dir = os.path.join(
+                getattr(selenium_cfg, 'VISUAL_BASELINE_DIR',
+                    selenium_cfg.HERE + '/visual_baselines'),
+                self._driver.name)
+        path = os.path.join(baseline_dir, name + '.png')
+
+        if region is not None:
+            if isinstance(region, basestring):
+                region = self(region)
+            # drivers that only capture the viewport would miss it otherwise
+            self._driver.execute_script("""
+                var r = arguments[0].getBoundingClientRect();
+                if (r.top < 0 || r.left < 0 || r.bottom > window.innerHeight
+                        || r.right > window.innerWidth) {
+                    arguments[0].scrollIntoView();
+                }
+                """, region)
+        png = self._driver.get_screenshot_as_png()
+        if region is not None:
+            png = visual.crop(png, self._driver.execute_script("""
+                var r = arguments[0].getBoundingClientRect();
+                return [r.left, r.top, r.width, r.height,
+                        window.pageXOffset, window.pageYOffset,
+                        window.innerHeight, window.devicePixelRatio || 1];
+                """, region))
+            if png is None:
+                raise TestFailure('%s: the region is outside the screenshot'
+                        % name)
+
+        baseline = visual.load_baseline(path)
+        if baseline is None or os.getenv('SELENIUM_UPDATE_BASELINES') == 'true':
+            if not os.path.exists(baseline_dir):
+                os.makedirs(baseline_dir)
+            with open(path, 'wb') as f:
+                f.write(png)
+            return
+
+        passed, message, diff = visual.compare(png, baseline, tolerance,
+                max_diff)
+        if passed:
+            return
+
+        results_dir = os.path.join(selenium_cfg.HERE, 'selenium_test_results',
+                'visual', self._driver.name)
+        if not os.path.exists(results_dir):
+            os.makedirs(results_dir)
+        with open(os.path.join(results_dir, name + '.actual.png'), 'wb') as f:
+            f.write(png)
+        if diff is not None:
+            with open(os.path.join(results_dir, name + '.diff.png'), 'wb') as f:
+                f.write(visual.encode(diff))
+        raise TestFailure('%s looks different from its baseline: %s'
+                % (name, message))
+
+    def get_session(self):
+        """ Returns the state needed to pick up where this browser is: the
+            site, the current URL, its cookies, and the page's localStorage
+            and sessionStorage.
+        """
+        try:
+            storage = self._driver.execute_script(_GET_STORAGE_SCRIPT)
+        except WebDriverException:
+            storage = None
+        return {
+            'domain': self.DOMAIN_NAME,
+            'url': self.current_url,
+            'cookies': self._driver.get_cookies(),
+            'storage': storage,
+        }
+
+    def restore_session(self, session):
+        """ Loads a session returned by :meth:`get_session` into this
+            browser.
+
+            :param dict session: Session from :meth:`get_session`
+
+            Cookies the driver won't take, like ones for another domain, are
+            left out.
+        """
+        # cookies and storage can only be set for the site that is loaded
+        self.home()
+        self._driver.delete_all_cookies()
+        for cookie in session['cookies']:
+            try:
+                self._driver.add_cookie(cookie)
+            except WebDriverException:
+                pass
+        storage = session.get('storage')
+        if storage and urlparse.urlparse(self.current_url).netloc == storage['host']:
+            try:
+                self._driver.execute_script(_SET_STORAGE_SCRIPT, storage)
+            except WebDriverException:
+                pass
+        self._driver.get(session['url'])
+
     def force_visible(self, element):
         """ Force something to be visible so Selenium doesn't bitch about
             interacting with it
@@ -496,7 +1019,14 @@ class Browser(object):
         global CURRENT_BROWSER
         if (not self.SECONDARY):
             CURRENT_BROWSER = None
-        self._driver.quit()
+        try:
+            self._driver.quit()
+        finally:
+            self.release_account()
+            GOVERNOR.release(self)
+            if self._display_lease:
+                self._display_lease.release()
+                self._display_lease = None
 
     def __call__(self, val=None):
         """ Super shortcut for finding an element or getting an ActionChains
@@ -522,17 +1052,37 @@ class Browser(object):
         return self.find(val)
 
 
+    def _sets_ready_flag(self, url):
+        """ Returns True for pages that set ``window.selenium_ready``: ours,
+            not 3rd party sites, but not in production, and not under
+            ``/content/``. Pages served by :data:`HTTP_ARCHIVE` count as
+            the site it stands in for.
+        """
+        u = urlparse.urlparse(url)
+        host = u.hostname or ''
+        if HTTP_ARCHIVE and u.netloc == HTTP_ARCHIVE.domain:
+            host = urlparse.urlparse(HTTP_ARCHIVE.upstream).hostname
+        return ('.about.me' in host
+                and not u.path.startswith('/content/'))
+
     def wait_until_ready(self):
-        # only wait if it's our stuff, not 3rd party sites but not in production
-        u = urlparse.urlparse(self.current_url)
-        if ( ('.about.me' or '127.0.0.1') in u.hostname 
-            and not u.path.startswith('/content/')):
+        url = self.current_url
+        if (self.animations_disabled and url != self._animations_url
+                and not self._sets_ready_flag(url)):
+            # nothing below runs a script on the page to do it with
+            try:
+                self._driver.execute_script(_NO_ANIMATIONS_SCRIPT)
+            except WebDriverException:
+                pass
+            self._animations_url = url
+        if self._sets_ready_flag(url):
             #time.sleep(getattr(selenium_cfg, 'SELENIUM_DELAY', 0))
             counter = 30
             result = False
             while (counter > 0):
                 # print 'checking for page readiness'
-                result = self._driver.execute_script('return window.selenium_ready')
+                result = self._driver.execute_script(
+                        self._with_page_setup('return window.selenium_ready'))
                 if (result):
                     break
                 # print 'page not ready yet'
@@ -550,107 +1100,427 @@ class Browser(object):
         def inner(*args, **kwargs):
             self.wait_until_ready()
             return func(*args, **kwargs)
+        inner.finder = getattr(func, 'finder', None)
         return inner
 
 
+    def _finder(self, attr):
+        """ Returns a find method that searches whatever :meth:`within`
+            scope is current when it's called.
+        """
+        find = lambda value: getattr(self, attr)(value)
+        # so recycle_browser() can make the same shortcut for a new browser
+        find.finder = attr
+        return find
+
     ### Selector shortcut properties ###
     @property
     def class_name(self):
-        return self._wait_until_ready_wrapper(self._driver.find_element_by_class_name)
+        return self._wait_until_ready_wrapper(self._finder('find_element_by_class_name'))
 
     @property
     def css_selector(self):
-        return self._wait_until_ready_wrapper(self._driver.find_element_by_css_selector)
+        return self._wait_until_ready_wrapper(self._finder('find_element_by_css_selector'))
 
     @property
     def id(self):
-        return self._wait_until_ready_wrapper(self._driver.find_element_by_id)
+        return self._wait_until_ready_wrapper(self._finder('find_element_by_id'))
 
     @property
     def link_text(self):
-        return self._wait_until_ready_wrapper(self._driver.find_element_by_link_text)
+        return self._wait_until_ready_wrapper(self._finder('find_element_by_link_text'))
 
     @property
     def name(self):
-        return self._wait_until_ready_wrapper(self._driver.find_element_by_name)
+        return self._wait_until_ready_wrapper(self._finder('find_element_by_name'))
 
     @property
     def partial_link_text(self):
-        return self._wait_until_ready_wrapper(self._driver.find_element_by_partial_link_text)
+        return self._wait_until_ready_wrapper(self._finder('find_element_by_partial_link_text'))
 
     @property
     def tag_name(self):
-        return self._wait_until_ready_wrapper(self._driver.find_element_by_tag_name)
+        return self._wait_until_ready_wrapper(self._finder('find_element_by_tag_name'))
 
     @property
     def xpath(self):
-        return self._wait_until_ready_wrapper(self._driver.find_element_by_xpath)
+        return self._wait_until_ready_wrapper(self._finder('find_element_by_xpath'))
+
+
+def _scoped_finder(element, attr):
+    """ Returns a WebElement's version of a find method, with absolute XPaths
+        made relative to the element so they don't search the whole page.
+    """
+    method = getattr(element, attr)
+    if attr.endswith('_xpath'):
+        return lambda xpath: method(_relative_xpath(xpath))
+    if attr in ('find_element', 'find_elements'):
+        def find(by=By.ID, value=None):
+            if by == By.XPATH:
+                value = _relative_xpath(value)
+            return method(by, value)
+        return find
+    return method
+
+
+# A string literal, or a / starting a path from the document root
+_XPATH_ROOT = re.compile(r'''("[^"]*"|'[^']*')|(^|[|(])(\s*)/''')
+
+def _relative_xpath(xpath):
+    """ Turns ``//a`` into ``.//a``, also after ``|`` and ``(``, but not
+        inside string literals.
+    """
+    return _XPATH_ROOT.sub(
+            lambda m: m.group(1) or m.group(2) + m.group(3) + './', xpath)
+
 
+def wait_in_page(driver, secs, condition, target):
+    """ Waits for a :class:`conditions.Condition` with an async script that
+        resolves as soon as the condition holds.
 
-def get_browser(name=None, resize=True, secondary=False, remote_address='localhost'):
+        :param driver: WebDriver to run the script with
+        :param int secs: Seconds to wait
+        :param condition: :class:`conditions.Condition` to wait for
+        :param target: What the condition's Python fallback is called with,
+            used when the script can't run
+        :returns: The condition's result
+        :raises: TimeoutException
+
+    """
+    script = condition.script
+    if isinstance(target, Browser):
+        script = target._with_page_setup(script)
+    deadline = time.time() + secs
+    while True:
+        # stay well inside the driver's script timeout
+        chunk = max(0, min(deadline - time.time(), 30))
+        polled = False
+        try:
+            result = driver.execute_async_script(script,
+                    int(chunk * 1000), condition.root, condition.args)
+        except WebDriverException:
+            # the page navigated away mid-wait, or can't run the script
+            polled = True
+            try:
+                result = condition(target)
+            except WebDriverException:
+                result = None
+        if result:
+            return result
+        if time.time() >= deadline:
+            raise TimeoutException('Timed out after %ss waiting for %s'
+                    % (secs, condition.description))
+        if polled:
+            time.sleep(0.1)
+
+
+def get_browser(name=None, resize=True, secondary=False, remote_address='localhost',
+        display=None, proxy=None):
     """ Returns a :class:`Browser` instance using the driver for the given
         browser name.
 
         :param str name: Name of the browser (default: ``firebug``)
 
         Browser name should be one of: ``firefox``, ``chrome``, ``ie``,
-        ``firebug``, ``remote``, or ``phantomjs``.
+        ``firebug``, ``remote``, ``phantomjs``, ``fake`` or ``replay``.
 
         Checks the environment variable ``SELENIUM_BROWSER`` for the browser
         name if none is supplied.
 
+        ``fake`` is an in-memory browser serving ``fakedriver.PAGES``, and
+        ``replay`` plays back the session recorded in the file named by the
+        ``SELENIUM_REPLAY`` environment variable. Setting ``SELENIUM_RECORD``
+        to a file name records the session of any other browser to it. See
+        :mod:`fakedriver`.
+
         :param str remote_address: Network name or IP of remote machine running
         remote selenium server.  The default is localhost, which is what you'd
         use for controlling a browser running under a different user on the
         same machine (default: ``localhost``)
+        :param bool display: Run ``firefox`` or ``chrome`` on a display of its
+            own leased from :data:`DISPLAYS` (default:
+            ``selenium_cfg.SELENIUM_XVFB``). See :mod:`xvfb`.
+        :param str proxy: ``host:port`` of an HTTP proxy for ``firefox``,
+            ``chrome``, ``phantomjs`` or ``remote`` (default: the
+            :data:`HTTP_ARCHIVE` server if one is running)
 
     """
     if not name:
         name = SELENIUM_BROWSER
 
+    if proxy is None and HTTP_ARCHIVE:
+        proxy = HTTP_ARCHIVE.domain
+    webdriver_proxy = None
+    firefox_options = selenium.webdriver.FirefoxOptions()
+    chrome_options = selenium.webdriver.ChromeOptions()
+    phantomjs_args = None
+    if proxy:
+        webdriver_proxy = Proxy({'proxyType': ProxyType.MANUAL,
+            'httpProxy': proxy, 'sslProxy': proxy})
+        chrome_options.add_argument('--proxy-server=http://' + proxy)
+        phantomjs_args = ['--proxy=' + proxy]
+
     drivers = {
-            'firefox': Firefox,
+            'firefox': lambda: Firefox(options=firefox_options,
+                proxy=webdriver_proxy),
             'ie': Ie,
             'chrome': lambda: Chrome(
-                executable_path=selenium_cfg.HERE + '/bin/chromedriver'),
+                executable_path=selenium_cfg.HERE + '/bin/chromedriver',
+                options=chrome_options),
             'remote': lambda: Remote(
                 command_executor='http://' + remote_address + ':4444/wd/hub',
-                desired_capabilities=DesiredCapabilities.FIREFOX),
-            'phantomjs': selenium.webdriver.PhantomJS
+                desired_capabilities=DesiredCapabilities.FIREFOX,
+                proxy=webdriver_proxy),
+            'phantomjs': lambda: selenium.webdriver.PhantomJS(
+                service_args=phantomjs_args),
+            'fake': fakedriver.fake_driver,
+            'replay': lambda: fakedriver.replay_driver(
+                os.getenv('SELENIUM_REPLAY')),
             }
-    browser = Browser(driver=drivers[name]())
+    if display is None:
+        display = getattr(selenium_cfg, 'SELENIUM_XVFB', False)
+    display_lease = None
+    if display and name in HEADED_BROWSERS:
+        global DISPLAYS
+        with _DISPLAY_LOCK:
+            if DISPLAYS is None:
+                DISPLAYS = xvfb.DisplayPool(xvfb.screen_size(WINDOW_SIZE),
+                        governor=GOVERNOR)
+                atexit.register(DISPLAYS.shutdown)
+        display_lease = DISPLAYS.lease()
+        # told to the browser rather than set in DISPLAY, which other
+        # threads launching browsers at the same time would see too
+        for options in (firefox_options, chrome_options):
+            options.add_argument('--display=' + display_lease.name)
+        try:
+            driver = drivers[name]()
+        except:
+            display_lease.release()
+            raise
+    else:
+        driver = drivers[name]()
+
+    if os.getenv('SELENIUM_RECORD') and name not in ('fake', 'replay'):
+        fakedriver.record(driver, os.getenv('SELENIUM_RECORD'))
+    browser = Browser(driver=driver)
     browser.SECONDARY = secondary
+    browser._display_lease = display_lease
+    # kept so recycle_browser() can launch the same kind of browser
+    browser._launch_args = dict(name=name, resize=resize, secondary=secondary,
+            remote_address=remote_address, display=display, proxy=proxy)
+    GOVERNOR.track(browser)
     return browser
 
 
-def autobrowser(func):
+def browser_for(module=None):
+    """ Returns the name of the browser a module's tests run in: the one
+        given to :func:`run_numbered_tests`, or else the module's own
+        ``SELENIUM_BROWSER`` attribute, or else :data:`SELENIUM_BROWSER`.
+    """
+    return (_run_browser or getattr(module, 'SELENIUM_BROWSER', None)
+            or SELENIUM_BROWSER)
+
+
+def _browser_name(browser):
+    """ Returns the name :func:`get_browser` launched a browser with, or
+        None for one that was made some other way.
+    """
+    return getattr(browser, '_launch_args', {}).get('name')
+
+
+class _Launch(threading.Thread):
+    """ Launches a maximized browser in the background. """
+    daemon = True
+    browser = None
+    error = None
+
+    def __init__(self, name):
+        threading.Thread.__init__(self)
+        self.browser_name = name
+
+    def run(self):
+        try:
+            browser = get_browser(self.browser_name)
+            browser.maximize()
+            self.browser = browser
+        except Exception:
+            self.error = sys.exc_info()
+
+
+def launch_browser(name=None):
+    """ Starts launching the next :func:`autobrowser` browser in the
+        background, so it's ready, or closer to it, by the time a test needs
+        it. :func:`new_browser` picks it up.
+
+        :param str name: Name of the browser (default:
+            :data:`SELENIUM_BROWSER`)
+    """
+    global _launch
+    if _launch is None:
+        _launch = _Launch(name or SELENIUM_BROWSER)
+        _launch.start()
+
+
+def new_browser(name=None):
+    """ Returns a maximized browser: the one :func:`launch_browser` started,
+        once it's up, or else a new one.
+
+        :param str name: Name of the browser (default:
+            :data:`SELENIUM_BROWSER`)
+    """
+    global _launch
+    name = name or SELENIUM_BROWSER
+    if _launch is not None and _launch.browser_name != name:
+        discard_launch()
+    launch, _launch = _launch, None
+    if launch is None:
+        browser = get_browser(name)
+        browser.maximize()
+        return browser
+    launch.join()
+    if launch.error:
+        raise launch.error[0], launch.error[1], launch.error[2]
+    return launch.browser
+
+
+def discard_launch():
+    """ Quits the browser :func:`launch_browser` started if nothing took it.
+    """
+    try:
+        browser = new_browser(_launch.browser_name) if _launch else None
+    except Exception:
+        return
+    if browser:
+        browser.quit()
+
+
+def recycle_browser(browser):
+    """ Replaces a browser with a freshly launched one that carries on from
+        the same session, then quits the old one.
+
+        :param browser: :class:`Browser` to replace
+        :returns: The new :class:`Browser`
+
+    """
+    session = browser.get_session()
+    fresh = get_browser(**browser._launch_args)
+    if browser.window_width:
+        fresh.breakpoint(browser.window_width)
+
+    # settings tests may have changed, and what has been collected so far
+    fresh.DOMAIN_NAME = browser.DOMAIN_NAME
+    fresh._schema = browser._schema
+    fresh._api_schema = browser._api_schema
+    fresh.animations_disabled = browser.animations_disabled
+    fresh.latency_log = browser.latency_log
+    fresh.page_metrics = browser.page_metrics
+    fresh.last_page_metrics = browser.last_page_metrics
+    if fresh.default_wait != browser.default_wait:
+        fresh.default_wait = browser.default_wait
+    finder = getattr(browser.shortcut_method, 'finder', None)
+    if finder:
+        # the shortcut finds with the browser it came from
+        fresh.shortcut_method = fresh._wait_until_ready_wrapper(
+                fresh._finder(finder))
+    else:
+        fresh.shortcut_method = browser.shortcut_method
+
+    fresh.restore_session(session)
+
+    # the account stays leased across the swap
+    fresh._account_lease = browser._account_lease
+    fresh.username = browser.username
+    fresh.password = browser.password
+    fresh.email = browser.email
+    browser._account_lease = None
+
+    try:
+        browser.quit()
+    except WebDriverException:
+        pass
+    return fresh
+
+
+def autobrowser(func=None, deadline=None):
     """ Decorator to ensure that we can pass in a :class:`Browser` instance to
         test methods if we want, and otherwise one is provided.
 
+        :param int deadline: Seconds the test may take before a
+            :class:`Watchdog` aborts it (default: :data:`TEST_DEADLINE`). Use
+            as ``@autobrowser(deadline=60)``.
+
+        A browser that was passed in is left to whoever passed it, even when
+        the test ran out of time and its processes were killed.
+
     """
+    if func is None:
+        return lambda func: autobrowser(func, deadline)
 
     @wraps(func)
     def wrapper(*args, **kwargs):
-        # Is there a browser being passed in?
-        has_browser = False
-        for arg in args:
-            if isinstance(arg, Browser):
-                has_browser = True
-
-        # Browser already exists, don't add it to args
-        if has_browser:
-            return func(*args, **kwargs)
-
-        # No browser, let's get one and pass it on
         global CURRENT_BROWSER
-        if not CURRENT_BROWSER:
-            CURRENT_BROWSER = get_browser()
-            CURRENT_BROWSER.maximize()
+        # Is there a browser being passed in?
+        browsers = [arg for arg in args if isinstance(arg, Browser)]
+
+        if browsers:
+            # Browser already exists, move it to the front so bound test
+            # methods still get it as their first argument
+            browser = browsers[0]
+            args = tuple(browsers) + tuple(arg for arg in args
+                    if not isinstance(arg, Browser))
+        else:
+            # No browser, let's get one and pass it on
+            name = browser_for(sys.modules.get(func.__module__))
+            if _browser_name(CURRENT_BROWSER) not in (None, name):
+                # left over from tests that run in another browser
+                CURRENT_BROWSER.quit()
+            if not CURRENT_BROWSER:
+                CURRENT_BROWSER = new_browser(name)
+            elif GOVERNOR.should_recycle(CURRENT_BROWSER):
+                CURRENT_BROWSER = recycle_browser(CURRENT_BROWSER)
+            GOVERNOR.count_test(CURRENT_BROWSER)
+            browser = CURRENT_BROWSER
+            args = (browser,) + args
+
+        seconds = test_deadline(deadline)
+        watchdog = None
+        # a test run by another one, or by run_breakpoints(), is already
+        # watched over
+        if seconds is not None and not Watchdog.watching():
+            if seconds <= 0:
+                raise TestTimeout('%s: out of time for the module'
+                        % func.__name__)
+            watchdog = Watchdog(seconds, browser, func.__name__)
+            watchdog.start()
 
         # catch exceptions to grab screenshots
+        finished = False
         try:
-            return func(CURRENT_BROWSER, *args, **kwargs)
-        except (Exception, AssertionError) as e:
+            try:
+                result, finished = func(*args, **kwargs), True
+                return result
+            finally:
+                if watchdog:
+                    watchdog.stop()
+        except (Exception, AssertionError, _DeadlinePassed) as e:
+            if watchdog and watchdog.fired:
+                watchdog.restore()
+                if finished:
+                    # the deadline went off between the test returning and
+                    # the watchdog stopping, so the test made it
+                    return result
+                if browser is CURRENT_BROWSER:
+                    # whatever went wrong, it was because the browser was
+                    # killed, so the next test gets a new one
+                    CURRENT_BROWSER = None
+                    try:
+                        browser.quit()
+                    except Exception:
+                        pass
+                raise TestTimeout('%s ran past its %gs deadline%s' % (
+                        func.__name__, round(seconds, 1),
+                        ''.join(' [%s]' % path for path in watchdog.artifacts))
+                        ), None, sys.exc_info()[2]
             if getattr(selenium_cfg, 'SELENIUM_SCREENSHOTS', False) and os.getenv('SELENIUM_SCREENSHOTS') == 'true':
                 if not getattr(e, 'msg', False):
                     e.msg = ''
@@ -664,16 +1534,447 @@ def autobrowser(func):
                         os.mkdir(image_path)
 
                     filename = str(time.time()) + '.jpg'
-                    CURRENT_BROWSER._driver.save_screenshot(image_path + filename)
+                    browser._driver.save_screenshot(image_path + filename)
                     e.msg += ' [SCREENSHOT: {}]'.format('images/' + filename)
                 except:
                     e.msg += ' (screenshot failed)'
             raise
 
+    # so @responsive can give each of its browsers the same deadline
+    wrapper.deadline = deadline
     return wrapper
 
 
-def run_numbered_tests(module, initial=0, through=99, td=True, reload_module=True, domain=None):
+def test_deadline(deadline=None):
+    """ Returns the seconds a test may take: its own deadline (default:
+        :data:`TEST_DEADLINE`) or what's left of the module's, whichever is
+        less, or None if neither is set.
+    """
+    if deadline is None:
+        deadline = TEST_DEADLINE
+    if _module_deadline is not None:
+        left = _module_deadline - time.time()
+        deadline = left if deadline is None else min(deadline, left)
+    return deadline
+
+
+class Watchdog(object):
+    """ Aborts a test that runs past its deadline, even one stuck in a driver
+        call.
+
+        At the deadline it saves a screenshot and the page source (see
+        :func:`capture_artifacts`), raises an exception in the test's thread
+        and kills the browser's processes, or ends the session of a remote
+        browser, which makes a blocked driver call fail so the exception can
+        go off. :func:`autobrowser` then raises :class:`TestTimeout` and drops
+        the dead browser so the next test gets a fresh one.
+
+        :param int seconds: Seconds until the deadline
+        :param browser: :class:`Browser` the test runs in
+        :param str name: Test name, used for the artifact files
+
+    """
+    # thread id -> the Watchdog running in that thread
+    _running = {}
+
+    def __init__(self, seconds, browser, name):
+        self.browser = browser
+        self.name = name
+        self.fired = False
+        self.artifacts = []
+        self._thread_id = threading.current_thread().ident
+        self._done = False
+        self._check_interval = None
+        self._lock = threading.Lock()
+        self._timer = threading.Timer(seconds, self._fire)
+        self._timer.daemon = True
+
+    @classmethod
+    def watching(cls):
+        """ Returns True if a Watchdog is running for the current thread. """
+        return threading.current_thread().ident in cls._running
+
+    def start(self):
+        self._running[self._thread_id] = self
+        self._timer.start()
+
+    def stop(self):
+        """ Called once the test is over, however it ended. """
+        try:
+            self._timer.cancel()
+            with self._lock:
+                self._done = True
+                if self.fired:
+                    # the test ended anyway, so the exception mustn't go off
+                    # later
+                    _async_raise(self._thread_id, None)
+        finally:
+            self._running.pop(self._thread_id, None)
+            self.restore()
+            # so no timer thread is left over when the interpreter exits
+            self._timer.join()
+
+    def restore(self):
+        """ Puts back the check interval :meth:`_fire` lowered. Called by
+            :meth:`stop`, and by whoever sees :attr:`fired` in case the
+            exception went off in the middle of :meth:`stop`. Safe to call
+            more than once.
+        """
+        with self._lock:
+            if self._check_interval is not None:
+                sys.setcheckinterval(self._check_interval)
+                self._check_interval = None
+
+    def _fire(self):
+        with self._lock:
+            if self._done:
+                return
+        artifacts = capture_artifacts(self.browser, self.name)
+        with self._lock:
+            # a test that ended while the artifacts were saved passed
+            if self._done:
+                return
+            self.fired = True
+            self.artifacts = artifacts
+            # pending exceptions are only looked at every check interval, which
+            # can be seconds in a loop that mostly sleeps
+            self._check_interval = sys.getcheckinterval()
+            sys.setcheckinterval(1)
+            _async_raise(self._thread_id, _DeadlinePassed)
+        if not getattr(self.browser, '_governor_processes', None):
+            # nothing local to kill, like with a remote browser
+            _end_session(self.browser._driver)
+        GOVERNOR.release(self.browser)
+
+
+def _async_raise(thread_id, exception):
+    """ Raises an exception class in another thread the next time it runs
+        Python code, or cancels a pending one if ``exception`` is None.
+    """
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_long(thread_id),
+            ctypes.py_object(exception) if exception else None)
+
+
+def capture_artifacts(browser, name):
+    """ Saves a screenshot and the page source of a browser that may be stuck
+        in a call, giving up after :data:`ARTIFACT_TIMEOUT` seconds.
+
+        :param browser: :class:`Browser` to capture
+        :param str name: Start of the file names
+        :returns: Paths of the files saved, in
+            ``selenium_test_results/timeouts``
+
+    """
+    path = os.path.join(selenium_cfg.HERE, 'selenium_test_results', 'timeouts')
+    if not os.path.exists(path):
+        os.makedirs(path)
+    base = os.path.join(path, '%s-%d' % (name, time.time()))
+    saved = []
+
+    def capture():
+        driver = _side_channel(browser._driver)
+        try:
+            if driver.save_screenshot(base + '.png'):
+                saved.append(base + '.png')
+            source = driver.page_source
+            with open(base + '.html', 'w') as f:
+                f.write(source.encode('utf-8'))
+            saved.append(base + '.html')
+        except Exception:
+            pass
+
+    thread = threading.Thread(target=capture)
+    thread.daemon = True
+    thread.start()
+    thread.join(ARTIFACT_TIMEOUT)
+    return list(saved)
+
+
+def _end_session(driver):
+    """ Ends a driver's session on its server, over a connection of its own.
+    """
+    channel = _side_channel(driver)
+    if channel is driver:
+        # in process, so nothing is blocked on the server
+        return
+    try:
+        channel.execute(Command.QUIT)
+    except Exception:
+        pass
+
+
+def _side_channel(driver):
+    """ Returns a copy of a driver with a connection of its own, so it can be
+        used while the driver is in the middle of a call.
+    """
+    url = getattr(driver.command_executor, '_url', None)
+    if not url:
+        return driver
+    channel = copy.copy(driver)
+    channel.command_executor = RemoteConnection(url, keep_alive=False)
+    return channel
+
+
+def responsive(*widths):
+    """ Decorator to mark a test as responsive over a list of window widths.
+
+        :param int widths: Widths to run the test at
+
+        When the test is called without a :class:`Browser` it is handed to
+        :func:`run_breakpoints`, which runs every width in its own browser at
+        the same time, each with the test's :func:`autobrowser` deadline.
+        Passing a browser in runs the test once, at whatever size that
+        browser already is::
+
+            @responsive(1000, 320)
+            @autobrowser
+            def test_02_bar_display(b, cls):
+                if b.get_window_size()['width'] >= 1000:
+                    assert b('.spotlight-banner').is_displayed()
+
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if any(isinstance(arg, Browser) for arg in args):
+                return func(*args, **kwargs)
+            return run_breakpoints(
+                lambda b: func(*(args + (b,)), **kwargs), widths,
+                deadline=getattr(func, 'deadline', None), name=func.__name__)
+
+        wrapper.breakpoints = widths
+        return wrapper
+    return decorator
+
+
+def run_breakpoints(test, widths, browser=None, deadline=None, name='test'):
+    """ Runs a test once per width, each in its own browser, in parallel.
+
+        :param callable test: Callable that takes a :class:`Browser`
+        :param list widths: Window widths to run the test at
+        :param browser: Browser whose session (URL and cookies) is copied to
+            each of the width browsers (default: the :func:`autobrowser`
+            instance)
+        :param int deadline: Seconds each width may take before its
+            :class:`Watchdog` aborts it (default: :data:`TEST_DEADLINE`)
+        :param str name: Test name, used for the artifact files
+        :returns: dict of width to ``None`` if it passed, otherwise the
+            exception it failed with
+        :raises: TestFailure if any of the widths failed
+
+    """
+    source = browser or CURRENT_BROWSER
+    session = source.get_session() if source else None
+    seconds = test_deadline(deadline)
+    if seconds is not None and seconds <= 0:
+        raise TestTimeout('%s: out of time for the module' % name)
+    results = {}
+    browsers = {}
+
+    def _run(width):
+        b = None
+        watchdog = None
+        try:
+            b = browsers[width] = get_browser(
+                    source and _browser_name(source), secondary=True)
+            if seconds is not None:
+                watchdog = Watchdog(seconds, b, '%s-%d' % (name, width))
+                watchdog.start()
+            # resize first so the page only renders once, at this width
+            b.breakpoint(width)
+            if session:
+                b.restore_session(session)
+            try:
+                test(b)
+            finally:
+                if watchdog:
+                    watchdog.stop()
+            results[width] = None
+        except (Exception, AssertionError, _DeadlinePassed) as e:
+            if watchdog and watchdog.fired:
+                watchdog.restore()
+                e = TestTimeout('%s at %spx ran past its %gs deadline%s' % (
+                        name, width, round(seconds, 1),
+                        ''.join(' [%s]' % path for path in watchdog.artifacts)))
+            else:
+                traceback.print_exc()
+            results[width] = e
+        finally:
+            if b:
+                try:
+                    b.quit()
+                except Exception:
+                    pass
+
+    threads = [threading.Thread(target=_run, args=(width,))
+            for width in widths]
+    for thread in threads:
+        # a width stuck where even its watchdog can't reach must not keep
+        # the process from exiting
+        thread.daemon = True
+        thread.start()
+    # time for the watchdogs to save artifacts and kill their browsers
+    give_up = (seconds is not None
+            and time.time() + seconds + 2 * ARTIFACT_TIMEOUT)
+    for width, thread in zip(widths, threads):
+        thread.join(max(0, give_up - time.time()) if give_up else None)
+        if thread.is_alive():
+            if width in browsers:
+                GOVERNOR.release(browsers[width])
+            results[width] = TestTimeout('%s at %spx did not stop after its '
+                    '%gs deadline' % (name, width, round(seconds, 1)))
+
+    failed = []
+    for width in widths:
+        error = results.get(width)
+        if error is None:
+            print "  %spx: ok" % width
+        else:
+            print "  %spx: FAIL (%s: %s)" % (width, type(error).__name__, error)
+            failed.append(str(width))
+
+    if failed:
+        raise TestFailure('Failed at breakpoints: %s' % ', '.join(failed))
+    return results
+
+
+def get_test_entity(module):
+    """ Returns what holds a module's tests: an instance of its ``TestClass``
+        with ``setup_class``/``teardown_class`` available as ``setup`` and
+        ``teardown``, or the module itself if it has no ``TestClass``.
+    """
+    try:
+        test_entity = module.TestClass()
+        if getattr(test_entity, 'setup_class', False):
+            test_entity.setup = module.TestClass.setup_class
+        if getattr(test_entity, 'teardown_class', False):
+            test_entity.teardown = module.TestClass.teardown_class
+    except:
+        test_entity = module
+    return test_entity
+
+
+def numbered_tests(test_entity, initial=0, through=99):
+    """ Returns the ``test_NN_sometest`` tests of a test entity numbered
+        ``initial`` through ``through``, in order.
+    """
+    test_range = ['%02d' % i for i in range(initial, through + 1)]
+    return [getattr(test_entity, name) for name in sorted(dir(test_entity))
+            if name.startswith('test_') and name[5:7] in test_range]
+
+
+def get_checkpoint_dir(module):
+    """ Returns where a module's checkpoints are kept, one directory per
+        browser, so runs of the module in other browsers don't share them.
+    """
+    return os.path.join(
+            getattr(selenium_cfg, 'SELENIUM_CHECKPOINT_DIR', None)
+                or os.path.join(selenium_cfg.HERE, '.checkpoints'),
+            browser_for(module), module.__name__.split('.')[-1])
+
+
+def save_checkpoint(browser, module, number):
+    """ Saves the state of a browser after a module's test passed, so a
+        later run can start right after it (see :func:`restore_checkpoint`).
+
+        :param browser: :class:`Browser` the test ran in
+        :param module: Module the test is from
+        :param int number: Number of the test
+
+    """
+    lease = browser._account_lease
+    checkpoint = {
+        'session': browser.get_session(),
+        'window_width': browser.window_width,
+        'username': browser.username,
+        'pool': lease and lease.pool,
+    }
+    checkpoint_dir = get_checkpoint_dir(module)
+    if not os.path.exists(checkpoint_dir):
+        try:
+            os.makedirs(checkpoint_dir)
+        except OSError:
+            # another run made it first
+            pass
+    path = os.path.join(checkpoint_dir, '%02d.json' % number)
+    # written in one go so an interrupted run can't leave half a file, under
+    # a name of its own so runs at the same time don't write the same file
+    temp_path = '%s.%d-%d.tmp' % (path, os.getpid(),
+            threading.current_thread().ident)
+    with open(temp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    try:
+        os.rename(temp_path, path)
+    except OSError as e:
+        # another run starting from scratch cleared it away
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def clear_checkpoints(module):
+    """ Removes a module's checkpoints. """
+    checkpoint_dir = get_checkpoint_dir(module)
+    if os.path.isdir(checkpoint_dir):
+        for filename in os.listdir(checkpoint_dir):
+            try:
+                os.remove(os.path.join(checkpoint_dir, filename))
+            except OSError as e:
+                # another run removed or renamed it meanwhile
+                if e.errno != errno.ENOENT:
+                    raise
+
+
+def restore_checkpoint(module, initial):
+    """ Starts the :func:`autobrowser` browser from the latest checkpoint
+        saved before test number ``initial``.
+
+        :param module: Module the tests are from
+        :param int initial: Number of the test about to run
+        :returns: Number of the test whose checkpoint was restored, or None
+            if there isn't one for the current :data:`DOMAIN_NAME`
+
+    """
+    global CURRENT_BROWSER
+    checkpoint_dir = get_checkpoint_dir(module)
+    if not os.path.isdir(checkpoint_dir):
+        return None
+    numbers = [int(filename[:2]) for filename in os.listdir(checkpoint_dir)
+            if filename.endswith('.json') and filename[:2].isdigit()]
+    numbers = [number for number in numbers if number < initial]
+    if not numbers:
+        return None
+    number = max(numbers)
+    try:
+        with open(os.path.join(checkpoint_dir, '%02d.json' % number)) as f:
+            checkpoint = json.load(f)
+    except IOError as e:
+        # another run starting from scratch cleared it away
+        if e.errno != errno.ENOENT:
+            raise
+        return None
+    if checkpoint['session'].get('domain') != DOMAIN_NAME:
+        # saved against another site, whose session is no use here
+        return None
+
+    if CURRENT_BROWSER:
+        CURRENT_BROWSER.quit()
+    browser = new_browser(browser_for(module))
+    if checkpoint['window_width'] not in (None, browser.window_width):
+        browser.breakpoint(checkpoint['window_width'])
+    if checkpoint['pool']:
+        # the saved cookies are for that exact account
+        browser._account_lease = accounts.lease_account(checkpoint['pool'],
+                username=checkpoint['username'])
+        browser.password = browser._account_lease.password
+    browser.username = checkpoint['username']
+    browser.restore_session(checkpoint['session'])
+    CURRENT_BROWSER = browser
+    return number
+
+
+def run_numbered_tests(module, initial=0, through=99, td=True, reload_module=True, domain=None,
+        results=None, checkpoints=None, deadline=None, module_deadline=None,
+        browser=None):
     """ Helper that runs a subset of tests in a module. Useful for debugging.
         Tests can also be contained in a class named ``TestClass``.
         Only works on tests with the ``test_NN_sometest`` naming convention.
@@ -686,28 +1987,48 @@ def run_numbered_tests(module, initial=0, through=99, td=True, reload_module=Tru
             (optional)
         :param bool reload_module: Reload the module before running tests
             (optional)
+        :param list results: List that gets a ``(test name, exception or
+            None)`` tuple appended for every test that is run (optional)
+        :param bool checkpoints: Save the browser's state after every test
+            that passes, and start from the one saved before ``initial``
+            instead of from scratch (default:
+            ``selenium_cfg.SELENIUM_CHECKPOINTS``)
+        :param int deadline: Seconds each test may take (default:
+            :data:`TEST_DEADLINE`), see :class:`Watchdog`
+        :param int module_deadline: Seconds all the tests together may take
+            (default: :data:`MODULE_DEADLINE`)
+        :param str browser: Name of the browser to run the tests in
+            (default: the module's ``SELENIUM_BROWSER`` attribute if it has
+            one, otherwise :data:`SELENIUM_BROWSER`)
 
     """
+    init()
     # reset domain name in case it was changed in a previous test
-    global DOMAIN_NAME
+    global DOMAIN_NAME, TEST_DEADLINE, _module_deadline, _run_browser
     if not domain:
         DOMAIN_NAME = get_domain_name()
     else:
         DOMAIN_NAME = domain
 
+    # start the browser now so it launches while the module loads, unless
+    # the module may pick another one when it's reloaded
+    name = browser or getattr(module, 'SELENIUM_BROWSER', None)
+    if (not CURRENT_BROWSER or td) and (name or SELENIUM_BROWSER) == SELENIUM_BROWSER:
+        launch_browser(SELENIUM_BROWSER)
+
     if reload_module:
         reload(module)
+    _run_browser = (browser or getattr(module, 'SELENIUM_BROWSER', None)
+            or SELENIUM_BROWSER)
+    if _browser_name(CURRENT_BROWSER) not in (None, _run_browser):
+        # left over from tests that run in another browser
+        CURRENT_BROWSER.quit()
 
-    try:
-        test_entity = module.TestClass()
-        if getattr(test_entity, 'setup_class', False):
-            test_entity.setup = module.TestClass.setup_class
-        if getattr(test_entity, 'teardown_class', False):
-            test_entity.teardown = module.TestClass.teardown_class
-    except:
-        test_entity = module
+    test_entity = get_test_entity(module)
 
-    if td:
+    # no browser, nothing to tear down, and the teardown would only take
+    # the one being launched and quit it
+    if td and CURRENT_BROWSER:
         try:
             test_entity.teardown()
         except:
@@ -716,26 +2037,173 @@ def run_numbered_tests(module, initial=0, through=99, td=True, reload_module=Tru
     if initial == 0 and getattr(test_entity, 'setup', False):
         test_entity.setup()
 
-    test_range = range(initial, through + 1)
+    if checkpoints is None:
+        checkpoints = getattr(selenium_cfg, 'SELENIUM_CHECKPOINTS', False)
+    if module_deadline is None:
+        module_deadline = MODULE_DEADLINE
+    default_deadline = TEST_DEADLINE
+    if deadline is not None:
+        TEST_DEADLINE = deadline
 
     start = time.time()
+    if module_deadline is not None:
+        _module_deadline = start + module_deadline
     try:
-        for test in (getattr(test_entity, name, lambda b: None)
-                for name in sorted(dir(test_entity))
-                if name[5:7] in ['%02d' % i for i in test_range]):
+        if checkpoints:
+            if initial == 0:
+                clear_checkpoints(module)
+            else:
+                restored = restore_checkpoint(module, initial)
+                if restored is not None:
+                    print "Restored the checkpoint after test %02d in %.1fs" % (
+                            restored, time.time() - start)
+
+        for test in numbered_tests(test_entity, initial, through):
             print "Running", test.func_name
-            test()
+            try:
+                test()
+            except:
+                if results is not None:
+                    results.append((test.func_name, sys.exc_info()[1]))
+                raise
+            if results is not None:
+                results.append((test.func_name, None))
+            if checkpoints and CURRENT_BROWSER:
+                save_checkpoint(CURRENT_BROWSER, module, int(test.func_name[5:7]))
 
         if td and getattr(test_entity, 'teardown', False):
             test_entity.teardown()
     except:
         traceback.print_exc()
     finally:
+        discard_launch()
+        TEST_DEADLINE = default_deadline
+        _module_deadline = None
+        _run_browser = None
         print '\a' * 5
         print "Tests run in %s" % timedelta(seconds=time.time() - start)
         return CURRENT_BROWSER
 
 
+def run_command(module_name, **kwargs):
+    """ Returns the command line that runs a module's numbered tests in a
+        fresh process, through :func:`run_main`.
+
+        :param str module_name: Name of the module to run tests from
+        :param kwargs: Passed on to :func:`run_numbered_tests`
+
+    """
+    return [sys.executable, '-u', '-c', 'import utils; utils.run_main()',
+            module_name, json.dumps(kwargs)]
+
+
+def run_main(argv=None):
+    """ Runs the tests given by a :func:`run_command` command line and exits
+        with 0 if they all passed, 1 otherwise. The last line printed is
+        ``RESULTS`` followed by a JSON list of ``[test name, error or null]``.
+    """
+    init()
+    module_name, kwargs = (argv or sys.argv[1:])[:2]
+    results = []
+    run_numbered_tests(__import__(module_name), results=results,
+            **json.loads(kwargs))
+    sys.stdout.write('RESULTS ' + json.dumps(
+            [(name, None if e is None else repr(e)) for name, e in results]) + '\n')
+    sys.exit(0 if results and all(e is None for name, e in results) else 1)
+
+
+def run_browser_matrix(module, browsers=None, timeout=None, **kwargs):
+    """ Runs a module's numbered tests against several browsers at the same
+        time, each in its own process, and prints the output grouped per
+        browser.
+
+        :param module: Module to run tests from
+        :param list browsers: Browser names understood by :func:`get_browser`
+            (default: ``selenium_cfg.SELENIUM_MATRIX_BROWSERS``)
+        :param int timeout: Seconds after which a browser's run is killed
+            (default: ``selenium_cfg.SELENIUM_MATRIX_TIMEOUT``)
+        :param kwargs: Passed on to :func:`run_numbered_tests`
+        :returns: dict of browser name to True if all its tests passed, False
+            if any failed, or None if it timed out
+
+        A browser that hangs or crashes only loses its own run; the others
+        carry on and are reported as usual.
+
+    """
+    init()
+    browsers = browsers or getattr(selenium_cfg, 'SELENIUM_MATRIX_BROWSERS',
+            ['firefox', 'chrome', 'phantomjs'])
+    timeout = timeout or getattr(selenium_cfg, 'SELENIUM_MATRIX_TIMEOUT', 1800)
+    # the runs have nothing to resume from, and would only get in each
+    # other's way
+    kwargs.setdefault('checkpoints', False)
+    cwd = os.path.dirname(os.path.abspath(module.__file__))
+
+    runs = {}
+    results = {}
+    try:
+        for name in browsers:
+            env = dict(os.environ, SELENIUM_BROWSER=name)
+            output = tempfile.TemporaryFile()
+            proc = subprocess.Popen(
+                    run_command(module.__name__, browser=name, **kwargs),
+                    cwd=cwd, env=env, stdout=output, stderr=subprocess.STDOUT,
+                    # own process group so the browser it spawned dies with it
+                    preexec_fn=getattr(os, 'setsid', None))
+            runs[name] = (proc, output)
+
+        start = time.time()
+        while len(results) < len(runs):
+            for name, (proc, output) in runs.items():
+                if name in results:
+                    continue
+                if proc.poll() is not None:
+                    results[name] = proc.returncode == 0
+                elif time.time() - start > timeout:
+                    _kill_process_group(proc)
+                    results[name] = None
+            time.sleep(0.5)
+    finally:
+        # the runs are out of reach of ctrl-c in their own process groups,
+        # so whatever stops this one stops them too
+        killed = False
+        for name, (proc, output) in runs.items():
+            if proc.poll() is None:
+                _kill_process_group(proc)
+                killed = True
+        if killed or None in results.values():
+            # like Xvfb servers, which have process groups of their own
+            GOVERNOR.reap_orphans()
+
+    for name in browsers:
+        proc, output = runs[name]
+        output.seek(0)
+        print '=' * 70
+        print name
+        print '=' * 70
+        print output.read()
+        output.close()
+
+    for name in browsers:
+        status = {True: 'ok', False: 'FAIL', None: 'TIMEOUT'}[results[name]]
+        print "%-12s %s" % (name, status)
+    return results
+
+
+def _kill_process_group(proc):
+    """ Kills a process started by :func:`run_browser_matrix` along with
+        everything it spawned.
+    """
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+        proc.wait()
+    except OSError:
+        pass
+
+
 def patch_WebElement():
     """ Changes the :class:`~selenium.webdriver.remote.webelement.WebElement`'s
         __repr__ method to be more useful.
@@ -767,13 +2235,17 @@ def patch_WebElement():
 
         """
         time.sleep(getattr(selenium_cfg, 'SELENIUM_DELAY', 0))
-        
-        if (tag == '*' or self.tag_name == tag):
-            # search this element too
-            add_here = '|../%s[contains(text(),"%s")]' % (self.tag_name, text)
-        else:
-            add_here = ''
-        return self.find_element_by_xpath(""".//%s[contains(text(),"%s")]%s""" % (tag, text, add_here))
+
+        # search this element too
+        condition = conditions.element_with_text(text, tag)
+        condition.root = self
+        browser = getattr(self.parent, '_browser', None)
+        wait = browser.default_wait if browser else Browser._default_wait
+        try:
+            return wait_in_page(self.parent, wait, condition, self)
+        except TimeoutException:
+            raise NoSuchElementException('No %s element in %r contains %r'
+                    % (tag, self, text))
 
 
     cls.__repr__ = _repr
@@ -792,4 +2264,7 @@ if True:
     patch_WebElement()
     suppress_logging()
 
+# Clean up after this run when it exits
+atexit.register(GOVERNOR.shutdown)
+
 
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Screenshot comparison used by :meth:`utils.Browser.assert_visual`.
+
+Needs ``numpy`` and ``PIL`` (or Pillow), which are only imported when a
+visual assertion is made.
+
+Comparing a screenshot against its baseline goes from cheapest to most
+expensive check:
+
+1. identical PNG bytes pass straight away
+2. a different size fails straight away
+3. otherwise a NumPy diff counts the pixels whose largest channel difference
+   is over the tolerance for that pixel
+
+There is no perceptual hash pre-check. A difference hash (dHash) was
+meant to fail screenshots early, but on flat areas of the page noise well
+within the tolerance flips its bits, so it failed screenshots that passed the
+pixel diff. How far apart the hashes are now only shows up in failure
+messages.
+
+A tolerance mask is a grayscale PNG the size of the baseline, stored next to
+it as ``<name>.mask.png``. Each pixel's value is the channel difference
+allowed there when it is more than the default tolerance, so black changes
+nothing and white ignores the pixel altogether (handy for dates, avatars and ads).
+
+"""
+import os
+from cStringIO import StringIO
+
+import numpy
+from PIL import Image
+
+
+# Decoded baselines, keyed by path and checked against the file's mtime
+_cache = {}
+
+
+def decode(png):
+    """ Returns a PNG's pixels as a height x width x 3 uint8 array.
+
+        :param str png: PNG file contents
+    """
+    return numpy.asarray(Image.open(StringIO(png)).convert('RGB'))
+
+
+def encode(pixels):
+    """ Returns an array from :func:`decode` as PNG file contents. """
+    out = StringIO()
+    Image.fromarray(pixels).save(out, 'PNG')
+    return out.getvalue()
+
+
+def dhash(pixels, size=8):
+    """ Returns the difference hash of an image as an int of ``size ** 2``
+        bits. Similar images have hashes a few bits apart.
+    """
+    small = Image.fromarray(pixels).convert('L').resize(
+            (size + 1, size), Image.BILINEAR)
+    gray = numpy.asarray(small, dtype=numpy.int16)
+    bits = (gray[:, 1:] > gray[:, :-1]).flatten()
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+
+def hash_distance(a, b):
+    """ Returns the number of bits two hashes from :func:`dhash` differ by.
+    """
+    return bin(a ^ b).count('1')
+
+
+def load_baseline(path):
+    """ Returns ``(png, pixels, hash, mask)`` for a baseline file, or None if
+        there is no baseline yet. ``mask`` is None without a mask file.
+    """
+    if not os.path.exists(path):
+        return None
+
+    mask_path = mask_path_for(path)
+    key = (os.path.getmtime(path),
+            os.path.exists(mask_path) and os.path.getmtime(mask_path))
+    cached = _cache.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+
+    with open(path, 'rb') as f:
+        png = f.read()
+    pixels = decode(png)
+    mask = None
+    if os.path.exists(mask_path):
+        mask = numpy.asarray(Image.open(mask_path).convert('L'))
+
+    baseline = (png, pixels, dhash(pixels), mask)
+    _cache[path] = (key, baseline)
+    return baseline
+
+
+def mask_path_for(path):
+    return os.path.splitext(path)[0] + '.mask.png'
+
+
+def compare(png, baseline, tolerance=16, max_diff_ratio=0.001):
+    """ Compares a screenshot with a baseline from :func:`load_baseline`.
+
+        :param str png: Screenshot PNG file contents
+        :param tuple baseline: Baseline from :func:`load_baseline`
+        :param int tolerance: Channel difference (0-255) allowed per pixel
+        :param float max_diff_ratio: Share of pixels allowed over tolerance
+        :returns: ``(passed, message, diff)``, where ``diff`` is an image
+            array highlighting the differing pixels, or None if it passed or
+            the sizes differ
+
+    """
+    base_png, base_pixels, base_hash, mask = baseline
+    if mask is not None and mask.shape != base_pixels.shape[:2]:
+        return False, 'mask %sx%s differs from baseline %sx%s' % (
+                mask.shape[1], mask.shape[0],
+                base_pixels.shape[1], base_pixels.shape[0]), None
+    if png == base_png:
+        return True, 'identical', None
+
+    pixels = decode(png)
+    if pixels.shape != base_pixels.shape:
+        return False, 'size %sx%s differs from baseline %sx%s' % (
+                pixels.shape[1], pixels.shape[0],
+                base_pixels.shape[1], base_pixels.shape[0]), None
+
+    delta = numpy.abs(pixels.astype(numpy.int16) - base_pixels).max(axis=2)
+    allowed = tolerance
+    if mask is not None:
+        allowed = numpy.maximum(mask, tolerance)
+    over = delta > allowed
+    if mask is not None:
+        over &= mask < 255
+
+    ratio = over.sum() / float(over.size)
+    message = '%.3f%% of pixels differ' % (ratio * 100)
+    if ratio <= max_diff_ratio:
+        return True, message, None
+    message += ', perceptual hash is %s bits off' % hash_distance(
+            dhash(pixels), base_hash)
+
+    # dim the actual screenshot and paint the differences red
+    diff = (pixels // 3).astype(numpy.uint8)
+    diff[over] = (255, 0, 0)
+    return False, message, diff
+
+
+def crop(png, rect):
+    """ Returns the PNG contents of an element's region of a screenshot.
+
+        :param str png: Screenshot PNG file contents
+        :param list rect: ``[left, top, width, height, scroll x, scroll y,
+            viewport height, device pixel ratio]``, with the position
+            relative to the viewport as from ``getBoundingClientRect()``
+        :returns: The region, cut down to the part inside the screenshot,
+            or None if none of it is
+
+    """
+    left, top, width, height, scroll_x, scroll_y, viewport, scale = rect
+    pixels = decode(png)
+    # some drivers capture the whole page and some just the viewport
+    if pixels.shape[0] > viewport * scale + 1:
+        left += scroll_x
+        top += scroll_y
+    right = min(int((left + width) * scale), pixels.shape[1])
+    bottom = min(int((top + height) * scale), pixels.shape[0])
+    # negative starts would count from the other edge
+    left, top = max(int(left * scale), 0), max(int(top * scale), 0)
+    if right <= left or bottom <= top:
+        return None
+    return encode(numpy.ascontiguousarray(pixels[top:bottom, left:right]))
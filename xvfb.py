@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Virtual X displays for running several headed browsers on one machine.
+
+Some tests only behave with a real, focused browser window, like typeahead
+fields that react to focus and blur. :func:`utils.get_browser` can give each
+such browser its own display by leasing one from a :class:`DisplayPool` of
+``Xvfb`` servers::
+
+    >>> b = utils.get_browser('firefox', display=True)
+
+or for every browser with ``selenium_cfg.SELENIUM_XVFB = True``.
+
+Servers are started on demand, up to ``selenium_cfg.XVFB_MAX_DISPLAYS`` of
+them, with a screen big enough for the window :meth:`utils.Browser.maximize`
+makes. Once a browser quits its display goes back to the pool and the next
+browser reuses the running server. Servers that died are started again, and
+all of them are stopped when the test process exits.
+
+Xvfb picks free display numbers itself (``-displayfd``), so pools in several
+test processes on the same machine don't get in each other's way.
+
+"""
+import os
+import time
+import select
+import signal
+import threading
+import subprocess
+
+import selenium_cfg
+
+
+# Seconds an Xvfb server gets to start accepting clients
+START_TIMEOUT = 10
+
+
+class XvfbError(Exception):
+    """ Raised when an Xvfb server can't be started or none frees up. """
+
+
+class DisplayLease(object):
+    """ A display held by one browser until :meth:`release` is called.
+
+        :param DisplayPool pool: Pool the display belongs to
+        :param int number: X display number
+        :param process: The display's ``Xvfb`` process
+
+    """
+    def __init__(self, pool, number, process):
+        self.pool = pool
+        self.number = number
+        self.process = process
+
+    @property
+    def name(self):
+        """ Value for the ``DISPLAY`` environment variable, like ``:99``. """
+        return ':%d' % self.number
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def release(self):
+        """ Gives the display back to the pool. Safe to call more than once.
+        """
+        if self.pool:
+            self.pool._give_back(self)
+            self.pool = None
+
+    def __repr__(self):
+        return '<DisplayLease(%s)>' % self.name
+
+
+class DisplayPool(object):
+    """ Starts and hands out ``Xvfb`` displays.
+
+        :param tuple size: Screen ``(width, height)`` in pixels
+        :param int max_displays: Most servers to run at once (default:
+            ``selenium_cfg.XVFB_MAX_DISPLAYS``)
+        :param str xvfb: Xvfb executable (default: ``selenium_cfg.XVFB_PATH``
+            or ``Xvfb``)
+        :param governor: :class:`governor.ResourceGovernor` to register the
+            servers with, so they are killed even if the test process is
+            (optional)
+
+    """
+    def __init__(self, size, max_displays=None, xvfb=None, governor=None):
+        self.size = size
+        self.governor = governor
+        self.max_displays = (max_displays
+                or getattr(selenium_cfg, 'XVFB_MAX_DISPLAYS', 4))
+        self.xvfb = xvfb or getattr(selenium_cfg, 'XVFB_PATH', 'Xvfb')
+
+        self._lock = threading.Condition()
+        self._idle = []      # (number, process) of servers nobody holds
+        self._leased = 0
+        self._processes = [] # every server started
+
+    def lease(self, timeout=60):
+        """ Returns a :class:`DisplayLease` for a free display, starting a
+            server if none is idle.
+
+            :param int timeout: Seconds to wait when every display is taken
+            :raises: XvfbError
+        """
+        deadline = time.time() + timeout
+        with self._lock:
+            while not self._idle and self._leased >= self.max_displays:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise XvfbError('No display freed up in %ss' % timeout)
+                self._lock.wait(remaining)
+            self._leased += 1
+            idle = self._idle.pop() if self._idle else None
+
+        if idle and idle[1].poll() is None:
+            return DisplayLease(self, *idle)
+        try:
+            return DisplayLease(self, *self._start())
+        except:
+            with self._lock:
+                self._leased -= 1
+                self._lock.notify()
+            raise
+
+    def _give_back(self, lease):
+        with self._lock:
+            self._leased -= 1
+            if lease.alive() and lease.process in self._processes:
+                self._idle.append((lease.number, lease.process))
+            self._lock.notify()
+
+    def _start(self):
+        """ Starts a server, returning ``(display number, process)`` once it
+            accepts connections.
+        """
+        read_fd, write_fd = os.pipe()
+        devnull = open(os.devnull, 'w')
+        try:
+            process = subprocess.Popen([self.xvfb,
+                    '-displayfd', str(write_fd),
+                    '-screen', '0', '%dx%dx24' % self.size,
+                    '-nolisten', 'tcp'],
+                    stdout=devnull, stderr=devnull, close_fds=False,
+                    # keep ctrl-c aimed at the tests from killing the display
+                    # before the browser on it has quit
+                    preexec_fn=os.setpgrp)
+        except OSError as e:
+            raise XvfbError('Could not run %s: %s' % (self.xvfb, e))
+        finally:
+            os.close(write_fd)
+            devnull.close()
+
+        # Xvfb writes the display number once it's ready for clients. Other
+        # processes started meanwhile may hold the pipe open too, so a dead
+        # Xvfb doesn't necessarily mean end of file.
+        number = ''
+        deadline = time.time() + START_TIMEOUT
+        try:
+            while not number.endswith('\n'):
+                remaining = deadline - time.time()
+                if remaining <= 0 or not select.select([read_fd], [], [], remaining)[0]:
+                    break
+                chunk = os.read(read_fd, 16)
+                if not chunk:
+                    break
+                number += chunk
+        finally:
+            os.close(read_fd)
+        number = number.strip()
+        if not number.isdigit():
+            _stop(process)
+            raise XvfbError('%s did not start (exit status %s)' % (self.xvfb,
+                process.returncode))
+        with self._lock:
+            self._processes.append(process)
+        if self.governor:
+            # its own process group keeps it out of killpg()
+            self.governor.track_process(process.pid)
+        return int(number), process
+
+    def shutdown(self):
+        """ Stops every server the pool started. Registered with ``atexit``
+            by :mod:`utils`.
+        """
+        with self._lock:
+            processes, self._processes = self._processes, []
+            self._idle = []
+        for process in processes:
+            _stop(process)
+            if self.governor:
+                self.governor.forget_process(process.pid)
+
+
+def _stop(process):
+    if process.poll() is not None:
+        return
+    try:
+        os.kill(process.pid, signal.SIGTERM)
+    except OSError:
+        return
+    for _ in range(20):
+        if process.poll() is not None:
+            return
+        time.sleep(0.1)
+    try:
+        os.kill(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    process.wait()
+
+
+def screen_size(window_size, margin=(200, 200)):
+    """ Returns the screen size that fits a browser window of
+        ``window_size``, with room for its position and window decorations.
+    """
+    return (window_size[0] + margin[0], window_size[1] + margin[1])